@@ -28,6 +28,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'recipes.metrics.MetricsMiddleware',
+    'recipes.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,11 +59,15 @@ TEMPLATES = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'PAGE_SIZE': 6,
 }
 
+APPROXIMATE_COUNT_THRESHOLD = 10000
+RECIPE_TAGS_BITMASK = True
+RECIPE_TAGS_SELECTIVE_SHARE = 0.1
+
 WSGI_APPLICATION = 'conf.wsgi.application'
 
 DATABASES = {
@@ -104,6 +110,78 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 MEDIA_URL = '/media/'
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOGUE_LOCAL_CACHE_SIZE = 256
+CATALOGUE_DATA_DIR = os.environ.get(
+    'CATALOGUE_DATA_DIR', os.path.join(BASE_DIR.parent.parent, 'data'))
+
+TOKEN_CACHE_TIMEOUT = 60 * 5
+TOKEN_CACHE_LOCAL_TTL = 5
+TOKEN_CACHE_LOCAL_SIZE = 1024
+
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+RECIPE_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+RECIPE_IMAGE_VARIANTS_DIR = 'recipe/variants/'
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': {'size': (200, 200), 'format': 'JPEG'},
+    'thumbnail_webp': {'size': (200, 200), 'format': 'WEBP'},
+    'card': {'size': (640, 640), 'format': 'JPEG'},
+    'card_webp': {'size': (640, 640), 'format': 'WEBP'},
+    'webp': {'size': None, 'format': 'WEBP'},
+}
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+
+PANTRY_INDEX_REFRESH = 60
+
+SIMILAR_RECIPES_TOP_K = 10
+SIMILAR_RECIPES_CHUNK_SIZE = 2000
+
+TIMELINE_WORKERS = int(os.environ.get('TIMELINE_WORKERS', 1))
+TIMELINE_BATCH_SIZE = 1000
+TIMELINE_BACKFILL = 100
+TIMELINE_FANOUT_MAX_SUBSCRIBERS = int(os.environ.get(
+    'TIMELINE_FANOUT_MAX_SUBSCRIBERS', 10000))
+
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+PROFILE_KEEP = 200
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0))
+SLOW_QUERY_ANALYZE = os.environ.get('SLOW_QUERY_ANALYZE') == '1'
+SLOW_QUERY_COOLDOWN = 60
+
+# /metrics отвечает только этим сетям или запросам с заголовком
+# `Authorization: Bearer <METRICS_TOKEN>`.
+METRICS_ALLOWED_NETWORKS = [
+    network.strip() for network in os.environ.get(
+        'METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128').split(',')
+    if network.strip()
+]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+SHOPPING_LIST_CHUNK_SIZE = 500
+SHOPPING_LIST_PDF_FONT = os.environ.get(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+SHOPPING_LIST_PDF_SPOOL_SIZE = 1024 * 1024
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.User'
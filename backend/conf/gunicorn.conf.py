@@ -0,0 +1,7 @@
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    """Убирает mmap-файлы метрик завершившегося воркера, чтобы его
+    значения gauge не попадали в /metrics."""
+    multiprocess.mark_process_dead(worker.pid)
@@ -18,7 +18,7 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = [IngredientInline]
 
     def favorites_score(self, instance):
-        return instance.favourite_set.count()
+        return instance.favorites_count
 
     readonly_fields = ('favorites_score',)
     favorites_score.short_description = 'В избранном у'
@@ -5,3 +5,7 @@ class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
     verbose_name = 'Рецепт'
+
+    def ready(self):
+        import recipes.checks  # noqa: F401
+        import recipes.signals  # noqa: F401
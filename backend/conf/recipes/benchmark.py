@@ -0,0 +1,179 @@
+import base64
+import io
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+PASSWORD = 'password'
+
+
+def _image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1024, 768), (200, 120, 80)).save(buffer, 'JPEG')
+    return ('data:image/jpeg;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def _consume(response):
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+class Scenarios:
+    """Набор замеряемых запросов к API.
+
+    Каждый сценарий — метод `scenario_<имя>`, который выполняет запрос
+    и возвращает ответ. Сценарии можно повторять: создаваемые данные
+    не мешают следующему прогону.
+    """
+
+    expected = {
+        'token_login': 201,
+        'recipes_create': 201,
+        'subscribe': 204,
+    }
+
+    def __init__(self, user):
+        self.user = user
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.image = _image()
+        tags = Tag.objects.order_by('id')
+        self.tag_ids = list(tags.values_list('id', flat=True)[:2])
+        self.tag_slugs = list(tags.values_list('slug', flat=True)[:2])
+        self.ingredient_ids = list(Ingredient.objects.order_by(
+            'id').values_list('id', flat=True)[:40])
+        self.recipe = Recipe.objects.filter(author=user).order_by(
+            '-id').first()
+        self.author = User.objects.exclude(pk=user.pk).exclude(
+            user_subscriptions__user=user).order_by('-recipes_count').first()
+        for recipe in Recipe.objects.exclude(
+                recipes__user=user).order_by('-id')[:10]:
+            self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+    @classmethod
+    def names(cls):
+        return [name[len('scenario_'):] for name in dir(cls)
+                if name.startswith('scenario_')]
+
+    def run(self, name):
+        response = _consume(getattr(self, f'scenario_{name}')())
+        expected = self.expected.get(name, 200)
+        if response.status_code != expected:
+            raise AssertionError(
+                f'{name}: ответ {response.status_code}, '
+                f'ожидался {expected}')
+
+    def payload(self, count):
+        return {
+            'name': 'Замер',
+            'text': 'Рецепт для замера производительности.',
+            'cooking_time': 30,
+            'tags': self.tag_ids,
+            'ingredients': [{'id': ingredient_id, 'amount': index + 1}
+                            for index, ingredient_id in enumerate(
+                                self.ingredient_ids[:count])],
+        }
+
+    def scenario_token_login(self):
+        return self.anonymous.post('/api/auth/token/login/', {
+            'email': self.user.email, 'password': PASSWORD})
+
+    def scenario_recipes_list(self):
+        return self.client.get('/api/recipes/?limit=6')
+
+    def scenario_recipes_list_filtered(self):
+        tags = '&'.join(f'tags={slug}' for slug in self.tag_slugs)
+        return self.client.get(f'/api/recipes/?{tags}&is_favorited=1')
+
+    def scenario_recipes_list_anonymous(self):
+        return self.anonymous.get('/api/recipes/?page=2')
+
+    def scenario_recipes_retrieve(self):
+        return self.client.get(f'/api/recipes/{self.recipe.pk}/')
+
+    def scenario_recipes_cookable(self):
+        ingredients = ','.join(map(str, self.ingredient_ids[:15]))
+        return self.client.get(
+            f'/api/recipes/cookable/?ingredients={ingredients}')
+
+    def scenario_recipes_feed(self):
+        return self.client.get('/api/recipes/feed/')
+
+    def scenario_recipes_similar(self):
+        return self.client.get(f'/api/recipes/{self.recipe.pk}/similar/')
+
+    def scenario_recipes_create(self):
+        return self.client.post('/api/recipes/', dict(
+            self.payload(20), image=self.image), format='json')
+
+    def scenario_recipes_update(self):
+        return self.client.patch(f'/api/recipes/{self.recipe.pk}/',
+                                 self.payload(40), format='json')
+
+    def scenario_download_shopping_cart(self):
+        return self.client.get('/api/recipes/download_shopping_cart/')
+
+    def scenario_subscriptions(self):
+        return self.client.get('/api/users/subscriptions/?recipes_limit=3')
+
+    def scenario_subscribe(self):
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        self.client.post(url)
+        return self.client.delete(url)
+
+    def scenario_ingredients_search(self):
+        return self.client.get('/api/ingredients/?name=мол')
+
+
+def measure(scenarios, name, repeat):
+    """Замеряет сценарий: время `repeat` прогонов, число SQL-запросов
+    и память отдельным прогоном под tracemalloc."""
+    scenarios.run(name)
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            scenarios.run(name)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(context))
+    tracemalloc.start()
+    try:
+        scenarios.run(name)
+        allocated, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': queries,
+        'time_ms': round(statistics.median(timings), 2),
+        'time_max_ms': round(max(timings), 2),
+        'peak_kb': round(peak / 1024, 1),
+        'allocated_kb': round(allocated / 1024, 1),
+    }
+
+
+def check_budgets(results, budgets):
+    """Возвращает список превышений бюджетов вида
+    `(сценарий, метрика, значение, бюджет)`."""
+    exceeded = []
+    for name, budget in budgets.items():
+        result = results.get(name)
+        if result is None:
+            continue
+        for metric, limit in budget.items():
+            if result[metric] > limit:
+                exceeded.append((name, metric, result[metric], limit))
+    return exceeded
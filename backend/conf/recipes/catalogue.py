@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Ingredient, Tag
+
+CATALOGUES = {
+    'tags': Tag,
+    'ingredients': Ingredient,
+}
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+_MISSING = object()
+
+
+def is_shared_cache():
+    """Общий ли кэш для всех процессов приложения."""
+    return (settings.CACHES['default']['BACKEND']
+            not in PROCESS_LOCAL_CACHES)
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш в памяти процесса."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+local_cache = LRUCache(settings.CATALOGUE_LOCAL_CACHE_SIZE)
+
+
+def _version_key(catalogue):
+    return f'catalogue:{catalogue}:version'
+
+
+def _value_key(catalogue, version, key):
+    digest = hashlib.md5(key.encode()).hexdigest()
+    return f'catalogue:{catalogue}:{version}:{digest}'
+
+
+def get_version(catalogue):
+    """Возвращает текущую версию каталога из общего кэша.
+
+    Версия общая для процессов, только если сам кэш общий
+    (см. `is_shared_cache`): с LocMemCache у каждого процесса своя.
+    """
+    version = cache.get(_version_key(catalogue))
+    if version is None:
+        cache.add(_version_key(catalogue), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(catalogue))
+    return version
+
+
+def invalidate(catalogue):
+    """Переводит каталог на новую версию во всех процессах,
+    которые видят тот же кэш. Возвращает новую версию."""
+    version = uuid.uuid4().hex
+    cache.set(_version_key(catalogue), version, timeout=None)
+    return version
+
+
+def make_etag(catalogue, version, key):
+    digest = hashlib.md5(f'{catalogue}:{version}:{key}'.encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def get_or_set(catalogue, version, key, loader):
+    """Берёт значение из кэша процесса, затем из общего кэша.
+
+    Если значения нет ни там, ни там, оно вычисляется `loader`
+    и сохраняется в оба кэша под текущей версией каталога.
+    """
+    value_key = _value_key(catalogue, version, key)
+    value = local_cache.get(value_key, _MISSING)
+    if value is _MISSING:
+        value = cache.get(value_key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            cache.set(value_key, value,
+                      timeout=settings.CATALOGUE_CACHE_TIMEOUT)
+        local_cache.set(value_key, value)
+    return value
+
+
+def get_objects(catalogue):
+    """Возвращает все объекты каталога в виде словаря {pk: объект}."""
+    return get_or_set(catalogue, get_version(catalogue), 'objects',
+                      CATALOGUES[catalogue].objects.in_bulk)
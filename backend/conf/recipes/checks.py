@@ -0,0 +1,18 @@
+from django.core.checks import Tags, Warning, register
+
+from recipes.catalogue import is_shared_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии каталогов и сброс токенов должны быть видны всем
+    процессам, поэтому в продакшене нужен общий кэш."""
+    if is_shared_cache():
+        return []
+    return [Warning(
+        'Кэш по умолчанию хранится в памяти процесса.',
+        hint=('Каталоги, сброшенные в одном процессе, остаются '
+              'устаревшими в других, а токены не кэшируются. Укажите '
+              'общий кэш через CACHE_BACKEND и CACHE_LOCATION.'),
+        id='recipes.W001',
+    )]
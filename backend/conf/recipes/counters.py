@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favourite, Recipe, Subscription
+from users.models import User
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def rebuild_counters():
+    """Пересчитывает денормализованные счётчики по исходным таблицам."""
+    with transaction.atomic():
+        User.objects.update(
+            recipes_count=_count(Recipe.objects.all(), 'author'),
+            subscribers_count=_count(Subscription.objects.all(),
+                                     'subscriptions'),
+        )
+        Recipe.objects.update(
+            favorites_count=_count(Favourite.objects.all(), 'recipe'),
+        )
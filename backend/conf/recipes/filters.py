@@ -1,17 +1,45 @@
-from django.db.models import Q
+import time
+
+from django.conf import settings
+from django.db.models import Count, F
 
 from django_filters import rest_framework, CharFilter, FilterSet
 
-from .models import Ingredient, Recipe, Favourite, ShoppingCard
+from . import catalogue
+from .models import Ingredient, Recipe, TAGS_BITMASK_SIZE, tags_bitmask
+from .search import search_ingredients, search_recipes
+
+
+def _load_tag_shares():
+    total = Recipe.objects.count()
+    if not total:
+        return {}
+    return {tag_id: count / total for tag_id, count in
+            Recipe.tags.through.objects.values('tag_id').annotate(
+                count=Count('id')).values_list('tag_id', 'count')}
+
+
+def tag_shares():
+    """Доли рецептов с каждым тегом {id тега: доля}.
+
+    Нужны только для выбора плана запроса, поэтому пересчитываются
+    раз в `CATALOGUE_CACHE_TIMEOUT` и могут немного отставать.
+    """
+    period = int(time.time() // settings.CATALOGUE_CACHE_TIMEOUT)
+    return catalogue.get_or_set('tags', catalogue.get_version('tags'),
+                                f'shares:{period}', _load_tag_shares)
 
 
 class IngredientFilter(FilterSet):
-    name = CharFilter(field_name='name', lookup_expr='icontains')
+    name = CharFilter(field_name='name', method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
 
+    def filter_name(self, queryset, name, value):
+        return search_ingredients(queryset, value)
+
 
 class RecipeFilter(FilterSet):
     is_favorited = rest_framework.BooleanFilter(field_name='favourites__user',
@@ -21,17 +49,18 @@ class RecipeFilter(FilterSet):
     author = rest_framework.CharFilter(field_name='author__username',
                                        method='filter_author')
     tags = rest_framework.CharFilter(method='filter_tags')
+    search = rest_framework.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'is_in_shopping_cart', 'author', 'tags']
+        fields = ['is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'search']
 
     def filter_is_favorited(self, queryset, name, value):
-        request = self.request
         if value:
-            recipe_pk_list = Favourite.objects.filter(
-                user=request.user).values_list('recipe_id', flat=True)
-            return queryset.filter(pk__in=recipe_pk_list)
+            if not self.request.user.is_authenticated:
+                return queryset.none()
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_author(self, queryset, name, value):
@@ -40,18 +69,34 @@ class RecipeFilter(FilterSet):
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        request = self.request
         if value:
-            recipe_pk_list = ShoppingCard.objects.get(
-                user=request.user).recipes.all().values_list('pk', flat=True)
-            return queryset.filter(pk__in=recipe_pk_list)
+            if not self.request.user.is_authenticated:
+                return queryset.none()
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
     def filter_tags(self, queryset, name, value):
-        tags = self.request.query_params.getlist('tags')
-        if tags:
-            conditions = Q()
-            for tag in tags:
-                conditions |= Q(tags__slug__icontains=tag)
-            return queryset.filter(conditions).distinct()
-        return queryset.none()
+        slugs = set(self.request.query_params.getlist('tags'))
+        tag_ids = [tag.pk for tag in catalogue.get_objects('tags').values()
+                   if tag.slug in slugs]
+        if not tag_ids:
+            return queryset.none()
+        # Маску можно проверить только перебором рецептов, зато без
+        # обращения к таблице связей: это быстрее, когда теги есть
+        # у заметной доли рецептов. Для редких тегов выборка по индексу
+        # таблицы связей быстрее в разы.
+        shares = tag_shares()
+        if (settings.RECIPE_TAGS_BITMASK
+                and max(tag_ids) <= TAGS_BITMASK_SIZE
+                and sum(shares.get(pk, 0) for pk in tag_ids)
+                >= settings.RECIPE_TAGS_SELECTIVE_SHARE):
+            return queryset.alias(
+                tags_match=F('tags_mask').bitand(tags_bitmask(tag_ids))
+            ).exclude(tags_match=0)
+        return queryset.filter(id__in=Recipe.tags.through.objects.filter(
+            tag_id__in=tag_ids).values('recipe_id'))
+
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
@@ -0,0 +1,114 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps
+
+from recipes import catalogue, similarity
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=settings.RECIPE_IMAGE_WORKERS)
+    return _executor
+
+
+def reset_executor(broken):
+    """Заменяет сломанный пул: процесс пула мог быть убит, например,
+    по нехватке памяти, и такой пул больше не принимает задачи."""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def variant_name(image_name, variant, image_format):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return (f'{settings.RECIPE_IMAGE_VARIANTS_DIR}{stem}_{variant}.'
+            f'{image_format.lower()}')
+
+
+def build_variants(image_name):
+    """Создаёт уменьшенные копии картинки рецепта.
+
+    Работает только с хранилищем файлов, без обращений к БД,
+    поэтому может выполняться в отдельном процессе.
+    Возвращает словарь {вариант: имя файла в хранилище}.
+    """
+    variants = {}
+    with default_storage.open(image_name) as file, \
+            Image.open(file) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA')
+        for variant, options in settings.RECIPE_IMAGE_VARIANTS.items():
+            picture = original.copy()
+            if options['size']:
+                picture.thumbnail(options['size'])
+            if options['format'] == 'JPEG' and picture.mode != 'RGB':
+                picture = picture.convert('RGB')
+            buffer = io.BytesIO()
+            picture.save(buffer, options['format'],
+                         quality=options.get('quality', 85))
+            name = variant_name(image_name, variant, options['format'])
+            variants[variant] = default_storage.save(
+                name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def save_variants(recipe_id, image_name, variants):
+    if Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+            image_variants=variants):
+        catalogue.invalidate(similarity.CATALOGUE)
+
+
+def _variants_built(recipe_id, image_name, future):
+    try:
+        try:
+            variants = future.result()
+        except BrokenProcessPool:
+            variants = build_variants(image_name)
+        save_variants(recipe_id, image_name, variants)
+    except Exception:
+        logger.exception('Failed to build image variants for recipe %s',
+                         recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe_id, image_name):
+    """Ставит построение вариантов картинки в очередь пула процессов.
+
+    При `RECIPE_IMAGE_WORKERS = 0` варианты строятся сразу. Сломанный
+    пул заменяется новым, а задачи, которые он потерял, выполняются
+    в потоке пула.
+    """
+    if not settings.RECIPE_IMAGE_WORKERS:
+        save_variants(recipe_id, image_name, build_variants(image_name))
+        return
+    executor = get_executor()
+    try:
+        future = executor.submit(build_variants, image_name)
+    except BrokenProcessPool:
+        reset_executor(executor)
+        future = get_executor().submit(build_variants, image_name)
+    future.add_done_callback(partial(_variants_built, recipe_id, image_name))
@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+import re
+from itertools import islice
+
+from django.db import connections, transaction
+
+from recipes import catalogue
+
+READ_CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def _iter_json(file):
+    """Потоково разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидается JSON-массив')
+    position = 1
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item['name'], item['measurement_unit']
+
+
+def _iter_csv(file):
+    for row in csv.reader(file):
+        if not row or row == ['name', 'measurement_unit']:
+            continue
+        yield row[0], row[1]
+
+
+def read_ingredients(path):
+    """Построчно читает ингредиенты из CSV или JSON без повторов."""
+    reader = _iter_json if str(path).endswith('.json') else _iter_csv
+    seen = set()
+    with open(path, encoding='utf-8', newline='') as file:
+        for name, unit in reader(file):
+            key = (name.strip(), unit.strip())
+            if not all(key) or key in seen:
+                continue
+            seen.add(key)
+            yield key
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_insert(model, rows, using='default', batch_size=1000):
+    """Вставляет пачками, пропуская уже существующие пары."""
+    for batch in _batches(rows, batch_size):
+        model.objects.using(using).bulk_create(
+            [model(name=name, measurement_unit=unit)
+             for name, unit in batch],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+
+
+class CSVStream:
+    """Файлоподобный объект для COPY: строки генератора переводятся
+    в CSV по мере чтения, и в памяти держится не больше одного
+    запрошенного куска."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.pending) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer.seek(0)
+            self.buffer.truncate()
+            self.writer.writerow(row)
+            self.pending += self.buffer.getvalue()
+        if size < 0:
+            size = len(self.pending)
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+
+def copy_insert(model, rows, using):
+    """Загружает строки через COPY во временную таблицу и переносит их
+    одним INSERT ... ON CONFLICT DO NOTHING."""
+    table = connections[using].ops.quote_name(model._meta.db_table)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE catalogue_load '
+            '(name varchar(201), measurement_unit varchar(201)) '
+            'ON COMMIT DROP'
+        )
+        cursor.cursor.copy_expert(
+            'COPY catalogue_load (name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)', CSVStream(rows))
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT name, measurement_unit FROM catalogue_load '
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'
+        )
+
+
+def load_ingredients(model, path, using='default', batch_size=1000):
+    """Загружает справочник ингредиентов из файла и возвращает число
+    добавленных записей. Повторная загрузка ничего не меняет."""
+    before = model.objects.using(using).count()
+    with transaction.atomic(using=using):
+        rows = read_ingredients(path)
+        if connections[using].vendor == 'postgresql':
+            copy_insert(model, rows, using)
+        else:
+            bulk_insert(model, rows, using, batch_size)
+    added = model.objects.using(using).count() - before
+    if added:
+        catalogue.invalidate('ingredients')
+    return added
@@ -0,0 +1,104 @@
+import io
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from recipes.benchmark import Scenarios, check_budgets, measure
+from recipes.catalogue import is_shared_cache
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время, память и число SQL-запросов основных '
+            'эндпоинтов на синтетических данных во временной базе и '
+            'сверяет результат с бюджетами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help='Запустить только эти сценарии.')
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--output', default='benchmark.json',
+                            help='Куда записать результаты в JSON.')
+        parser.add_argument(
+            '--budgets',
+            default=os.path.join(settings.BASE_DIR, 'benchmark_budgets.json'),
+            help='JSON с бюджетами; пустая строка отключает проверку.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не пересоздавать тестовую базу.')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or Scenarios.names()
+        unknown = set(names) - set(Scenarios.names())
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with tempfile.TemporaryDirectory() as media, \
+                    tempfile.TemporaryDirectory() as cache, \
+                    override_settings(
+                        MEDIA_ROOT=media, RECIPE_IMAGE_WORKERS=0,
+                        TIMELINE_WORKERS=0, CACHES=self.caches(cache)):
+                results = self.run_scenarios(names, options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        budgets = {}
+        if options['budgets']:
+            with open(options['budgets'], encoding='utf-8') as file:
+                budgets = json.load(file)
+        exceeded = check_budgets(results, budgets)
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump({
+                'dataset': {key: options[key]
+                            for key in ('users', 'recipes', 'seed')},
+                'results': results,
+                'exceeded': [dict(zip(('scenario', 'metric', 'value',
+                                       'budget'), item))
+                             for item in exceeded],
+            }, file, ensure_ascii=False, indent=2)
+        for name, metric, value, limit in exceeded:
+            self.stderr.write(f'{name}: {metric} = {value} > {limit}')
+        if exceeded:
+            raise CommandError('Бюджеты превышены')
+        self.stdout.write(self.style.SUCCESS('Бюджеты соблюдены'))
+
+    @staticmethod
+    def caches(location):
+        """В развёртывании кэш общий, поэтому кэш в памяти процесса
+        на время замеров заменяется файловым."""
+        if is_shared_cache():
+            return settings.CACHES
+        return {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}
+
+    def run_scenarios(self, names, options):
+        if not User.objects.filter(username='bench_0').exists():
+            call_command('generate_fake_data', users=options['users'],
+                         recipes=options['recipes'], seed=options['seed'],
+                         prefix='bench', stdout=io.StringIO())
+        scenarios = Scenarios(User.objects.get(username='bench_0'))
+        results = {}
+        for name in names:
+            results[name] = result = measure(scenarios, name,
+                                             options['repeat'])
+            self.stdout.write(
+                f'{name:32} {result["queries"]:4} q '
+                f'{result["time_ms"]:9.2f} ms '
+                f'{result["peak_kb"]:9.1f} KiB')
+        return results
@@ -0,0 +1,43 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_variants, save_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит варианты картинок для уже загруженных рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            default=max(settings.RECIPE_IMAGE_WORKERS, 1),
+            help='Количество процессов.')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить варианты и для рецептов, где они уже есть.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        recipes = recipes.values_list('pk', 'image')
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(build_variants, image): (pk, image)
+                for pk, image in recipes.iterator()
+            }
+            for future in as_completed(futures):
+                pk, image = futures[future]
+                try:
+                    save_variants(pk, image, future.result())
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'Рецепт {pk}: {error}')
+                else:
+                    built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {built}, с ошибками: {failed}'))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import build_similarities
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты по совместному добавлению '
+            'в избранное. По умолчанию только для рецептов, затронутых '
+            'изменениями избранного с прошлого запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все рецепты.')
+        parser.add_argument('--top-k', type=int,
+                            default=settings.SIMILAR_RECIPES_TOP_K)
+        parser.add_argument('--min-common', type=int, default=1,
+                            help='Минимум общих пользователей у пары.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=settings.SIMILAR_RECIPES_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = build_similarities(
+            full=options['full'], top_k=options['top_k'],
+            min_common=options['min_common'],
+            chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {updated} '
+            f'за {time.monotonic() - started:.2f} с'))
@@ -0,0 +1,51 @@
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Находит файлы картинок рецептов, на которые не ссылается '
+            'ни один рецепт, и при --delete удаляет их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help='Удалить найденные файлы.')
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='Не трогать файлы моложе указанного числа минут.')
+
+    def walk(self, path):
+        directories, files = default_storage.listdir(path)
+        for name in files:
+            yield os.path.join(path, name)
+        for directory in directories:
+            yield from self.walk(os.path.join(path, directory))
+
+    def handle(self, *args, **options):
+        referenced = set()
+        for image, variants in Recipe.objects.values_list(
+                'image', 'image_variants').iterator():
+            referenced.add(image)
+            referenced.update((variants or {}).values())
+        threshold = timezone.now() - timedelta(minutes=options['min_age'])
+        root = Recipe._meta.get_field('image').upload_to
+        orphans = 0
+        if not default_storage.exists(root):
+            return
+        for name in self.walk(root.rstrip('/')):
+            if name in referenced:
+                continue
+            if default_storage.get_modified_time(name) > threshold:
+                continue
+            orphans += 1
+            self.stdout.write(name)
+            if options['delete']:
+                default_storage.delete(name)
+        action = 'Удалено' if options['delete'] else 'Найдено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов без рецепта: {orphans}'))
@@ -0,0 +1,274 @@
+import io
+import os
+import random
+import time
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes import catalogue, pantry
+from recipes.counters import rebuild_counters
+from recipes.loader import load_ingredients
+from recipes.models import (Favourite, Ingredient, IngredientWithQuantity,
+                            Recipe, ShoppingCard, Subscription, Tag,
+                            tags_bitmask)
+from recipes.search import rebuild_recipe_index
+from recipes.shopping import apply_drift, find_drift
+from recipes.similarity import build_similarities
+from recipes.timeline import rebuild_timelines
+from users.models import User
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#D23F8E', 'dessert'),
+    ('Выпечка', '#C9A227', 'bakery'),
+    ('Постное', '#2D9CDB', 'lenten'),
+)
+WORDS = ('суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'омлет',
+         'борщ', 'котлеты', 'плов', 'блины', 'паста', 'соус', 'торт',
+         'домашний', 'быстрый', 'летний', 'острый', 'сливочный', 'с грибами',
+         'с курицей', 'с сыром', 'по-деревенски', 'на скорую руку')
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса распределения Ципфа для `random.choices`."""
+    return list(accumulate(1 / (rank + 1) ** exponent
+                           for rank in range(size)))
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'избранным, подписками и списками покупок для нагрузочных '
+            'тестов. При одинаковом --seed данные совпадают.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favourites', type=int, default=20,
+                            help='Среднее число избранных на пользователя.')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Среднее число рецептов в списке покупок.')
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Среднее число ингредиентов в рецепте.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='fake')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def check_options(self, options):
+        for name in ('users', 'recipes', 'favourites', 'subscriptions',
+                     'cart', 'ingredients'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} не может быть меньше нуля.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        if options['recipes'] and not options['users']:
+            raise CommandError('Рецептам нужны авторы, укажите --users '
+                               'больше нуля.')
+
+    def handle(self, *args, **options):
+        self.check_options(options)
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix}_ уже есть, '
+                'укажите другой --prefix.')
+        started = time.monotonic()
+        tag_ids = self.prepare_tags()
+        ingredient_ids = self.prepare_ingredients()
+        user_ids = self.create_users(prefix, options['users'])
+        recipe_ids = self.create_recipes(
+            user_ids, tag_ids, ingredient_ids, options['recipes'],
+            options['ingredients'])
+        self.create_favourites(user_ids, recipe_ids, options['favourites'])
+        self.create_subscriptions(user_ids, options['subscriptions'])
+        self.create_carts(user_ids, recipe_ids, options['cart'])
+        rebuild_counters()
+        rebuild_recipe_index()
+        catalogue.invalidate(pantry.CATALOGUE)
+        build_similarities(full=True)
+        rebuild_timelines()
+        apply_drift(find_drift())
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с'))
+
+    def report(self, label, count):
+        self.stdout.write(f'{label}: {count}')
+
+    def bulk_create(self, model, rows):
+        """Пишет объекты пачками по --batch-size, каждую в своей
+        транзакции, не держа весь набор в памяти."""
+        batch = []
+        total = 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                total += self.flush(model, batch)
+                batch = []
+        if batch:
+            total += self.flush(model, batch)
+        return total
+
+    @staticmethod
+    def flush(model, batch):
+        with transaction.atomic():
+            model.objects.bulk_create(batch, batch_size=len(batch))
+        return len(batch)
+
+    def draw(self, population, cum_weights, count, exclude=None):
+        """Выбирает до `count` разных элементов с заданными весами."""
+        count = min(count, len(population) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < count:
+            for item in self.rng.choices(population, cum_weights=cum_weights,
+                                         k=count - len(chosen)):
+                if item != exclude:
+                    chosen.add(item)
+        return sorted(chosen)
+
+    def around(self, mean):
+        """Случайное неотрицательное число со средним `mean`."""
+        return int(self.rng.expovariate(1 / mean)) if mean > 0 else 0
+
+    def prepare_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS)
+            catalogue.invalidate('tags')
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def prepare_ingredients(self):
+        if not Ingredient.objects.exists():
+            load_ingredients(Ingredient, os.path.join(
+                settings.CATALOGUE_DATA_DIR, 'ingredients.csv'))
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError('Справочник ингредиентов пуст, '
+                               'выполните load_catalogue.')
+        return ingredient_ids
+
+    def new_ids(self, model, last_id):
+        return list(model.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True))
+
+    def last_id(self, model):
+        return model.objects.aggregate(last=Max('id'))['last'] or 0
+
+    def create_users(self, prefix, count):
+        password = make_password('password')
+        last_id = self.last_id(User)
+        self.report('Пользователи', self.bulk_create(User, (
+            User(username=f'{prefix}_{number}',
+                 email=f'{prefix}_{number}@example.com',
+                 first_name=f'Имя{number}', last_name=f'Фамилия{number}',
+                 password=password)
+            for number in range(count)
+        )))
+        return self.new_ids(User, last_id)
+
+    def make_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (222, 184, 135)).save(buffer, 'JPEG')
+        upload_to = Recipe._meta.get_field('image').upload_to
+        return default_storage.save(f'{upload_to}fake.jpg',
+                                    ContentFile(buffer.getvalue()))
+
+    def create_recipes(self, user_ids, tag_ids, ingredient_ids, count,
+                       ingredients_per_recipe):
+        """Создаёт рецепты пачками вместе с их тегами и ингредиентами.
+
+        Авторы и ингредиенты выбираются по Ципфу: немногие популярные
+        авторы пишут большую часть рецептов, а соль и мука встречаются
+        чаще экзотики.
+        """
+        rng = self.rng
+        image = self.make_image()
+        author_weights = zipf_weights(len(user_ids), 1.1)
+        tag_weights = zipf_weights(len(tag_ids), 0.8)
+        ingredient_weights = zipf_weights(len(ingredient_ids), 1.0)
+        recipe_tag = Recipe.tags.through
+        recipe_ids = []
+        links = amounts = 0
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            tags = [self.draw(tag_ids, tag_weights, rng.randint(1, 3))
+                    for _ in range(size)]
+            authors = rng.choices(user_ids, cum_weights=author_weights,
+                                  k=size)
+            last_id = self.last_id(Recipe)
+            self.flush(Recipe, [
+                Recipe(author_id=author,
+                       name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                       text=' '.join(rng.choices(WORDS, k=40)),
+                       cooking_time=rng.randint(5, 180),
+                       image=image,
+                       tags_mask=tags_bitmask(recipe_tags))
+                for author, recipe_tags in zip(authors, tags)
+            ])
+            batch_ids = self.new_ids(Recipe, last_id)
+            links += self.bulk_create(recipe_tag, (
+                recipe_tag(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id, recipe_tags in zip(batch_ids, tags)
+                for tag_id in recipe_tags
+            ))
+            amounts += self.bulk_create(IngredientWithQuantity, (
+                IngredientWithQuantity(recipe_id=recipe_id,
+                                       ingredient_id=ingredient_id,
+                                       amount=rng.randint(1, 500))
+                for recipe_id in batch_ids
+                for ingredient_id in self.draw(
+                    ingredient_ids, ingredient_weights,
+                    max(1, self.around(ingredients_per_recipe)))
+            ))
+            recipe_ids.extend(batch_ids)
+        self.report('Рецепты', len(recipe_ids))
+        self.report('Теги рецептов', links)
+        self.report('Ингредиенты рецептов', amounts)
+        return recipe_ids
+
+    def create_favourites(self, user_ids, recipe_ids, mean):
+        weights = zipf_weights(len(recipe_ids), 0.9)
+        self.report('Избранное', self.bulk_create(Favourite, (
+            Favourite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in self.draw(recipe_ids, weights,
+                                       self.around(mean))
+        )))
+
+    def create_subscriptions(self, user_ids, mean):
+        weights = zipf_weights(len(user_ids), 1.1)
+        self.report('Подписки', self.bulk_create(Subscription, (
+            Subscription(user_id=user_id, subscriptions_id=author_id)
+            for user_id in user_ids
+            for author_id in self.draw(user_ids, weights,
+                                       self.around(mean), exclude=user_id)
+        )))
+
+    def create_carts(self, user_ids, recipe_ids, mean):
+        weights = zipf_weights(len(recipe_ids), 0.9)
+        sizes = {user_id: self.around(mean) for user_id in user_ids}
+        last_id = self.last_id(ShoppingCard)
+        self.bulk_create(ShoppingCard, (
+            ShoppingCard(user_id=user_id) for user_id in user_ids))
+        card_ids = self.new_ids(ShoppingCard, last_id)
+        through = ShoppingCard.recipes.through
+        self.report('Рецепты в списках покупок', self.bulk_create(through, (
+            through(shoppingcard_id=card_id, recipe_id=recipe_id)
+            for card_id, user_id in zip(card_ids, user_ids)
+            if sizes[user_id]
+            for recipe_id in self.draw(recipe_ids, weights, sizes[user_id])
+        )))
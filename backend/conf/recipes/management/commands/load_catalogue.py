@@ -0,0 +1,33 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.loader import load_ingredients
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = ('Загружает справочник ингредиентов из CSV или JSON. '
+            'Уже существующие пары имя/единица пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.CATALOGUE_DATA_DIR,
+                                 'ingredients.csv'),
+            help='Файл ingredients.csv или ingredients.json.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'Файл не найден: {path}')
+        started = time.monotonic()
+        added = load_ingredients(Ingredient, path, options['database'],
+                                 options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено ингредиентов: {added} '
+            f'за {time.monotonic() - started:.2f} с'))
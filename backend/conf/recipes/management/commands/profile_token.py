@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    help = ('Выводит заголовок X-Profile, с которым запрос будет '
+            'профилирован. Действует PROFILE_TOKEN_MAX_AGE секунд.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'X-Profile: {make_profile_token()}')
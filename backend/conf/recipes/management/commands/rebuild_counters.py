@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает recipes_count, subscribers_count '
+            'и favorites_count.')
+
+    def handle(self, *args, **options):
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from django.db import transaction
+
+from recipes.shopping import confirmed_drift, drifted_users, repair
+
+
+class Command(BaseCommand):
+    help = ('Сверяет итоги списков покупок с корзинами и исправляет '
+            'расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            count = repair(drifted_users())
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено позиций: {count}'))
+            return
+        count = 0
+        for user_id in drifted_users():
+            with transaction.atomic():
+                drift = confirmed_drift(user_id)
+            for user_id, ingredient_id, expected, stored in drift:
+                count += 1
+                self.stdout.write(
+                    f'user={user_id} ingredient={ingredient_id} '
+                    f'expected={expected} stored={stored}')
+        if count:
+            raise CommandError(f'Расхождений: {count}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
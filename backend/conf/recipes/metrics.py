@@ -0,0 +1,202 @@
+import hmac
+import ipaddress
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Histogram, generate_latest,
+                               multiprocess)
+
+LABELS = ('view', 'action', 'method')
+
+REQUEST_SECONDS = Histogram(
+    'foodgram_request_seconds', 'Время обработки запроса.',
+    LABELS + ('status',))
+QUERIES = Histogram(
+    'foodgram_request_queries', 'SQL-запросов на запрос.', LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float('inf')))
+QUERY_SECONDS = Histogram(
+    'foodgram_request_query_seconds', 'Время SQL-запросов на запрос.',
+    LABELS)
+SERIALIZER_SECONDS = Histogram(
+    'foodgram_request_serializer_seconds',
+    'Время сериализаторов на запрос.', LABELS)
+RESPONSE_BYTES = Histogram(
+    'foodgram_response_bytes', 'Размер ответа.', LABELS,
+    buckets=tuple(2 ** power for power in range(8, 25, 2)) + (
+        float('inf'),))
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Счётчики одного запроса, которые копятся по ходу обработки."""
+
+    def __init__(self):
+        self.labels = ('unresolved', '', '')
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+
+
+@contextmanager
+def serializer_timer():
+    """Прибавляет время к сериализаторам текущего запроса. Вложенные
+    сериализаторы не считаются повторно."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_depth -= 1
+        if not metrics.serializer_depth:
+            metrics.serializer_seconds += time.perf_counter() - started
+
+
+class MeasuredSerializer:
+    """Обёртка сериализатора, которая замеряет `is_valid` и `data`.
+
+    Остальные атрибуты берутся у самого сериализатора.
+    """
+
+    def __init__(self, serializer):
+        self.__dict__['serializer'] = serializer
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+    def is_valid(self, *args, **kwargs):
+        with serializer_timer():
+            return self.serializer.is_valid(*args, **kwargs)
+
+    @property
+    def data(self):
+        with serializer_timer():
+            return self.serializer.data
+
+
+def measured(serializer):
+    return MeasuredSerializer(serializer)
+
+
+class MeasuredSerializerMixin:
+    """Замеряет сериализаторы вьюсета, созданные `get_serializer`.
+
+    Сериализаторы, которые вьюсет создаёт сам, оборачиваются
+    в `measured` явно.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        return measured(super().get_serializer(*args, **kwargs))
+
+
+def view_labels(request, view_func):
+    """Имя вьюсета и действия DRF, для остальных — имя функции."""
+    view = getattr(view_func, 'cls', view_func)
+    actions = getattr(view_func, 'actions', None) or {}
+    return (getattr(view, '__name__', type(view).__name__),
+            actions.get(request.method.lower(), ''), request.method)
+
+
+class MetricsMiddleware:
+    """Пишет в Prometheus длительность, число и время SQL-запросов,
+    время сериализаторов и размер ответа по каждому вьюсету и действию.
+
+    У потоковых ответов запросы, выполненные при отдаче тела, тоже
+    учитываются, а длительность — только до начала отдачи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        labels = metrics.labels
+        REQUEST_SECONDS.labels(*labels, response.status_code).observe(
+            time.perf_counter() - started)
+        SERIALIZER_SECONDS.labels(*labels).observe(
+            metrics.serializer_seconds)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, metrics)
+        else:
+            self.observe_queries(metrics)
+            RESPONSE_BYTES.labels(*labels).observe(len(response.content))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.labels = view_labels(request, view_func)
+
+    @staticmethod
+    def observe_queries(metrics):
+        QUERIES.labels(*metrics.labels).observe(metrics.queries)
+        QUERY_SECONDS.labels(*metrics.labels).observe(metrics.query_seconds)
+
+    def stream(self, content, metrics):
+        size = 0
+        try:
+            with connection.execute_wrapper(metrics):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.observe_queries(metrics)
+            RESPONSE_BYTES.labels(*metrics.labels).observe(size)
+
+
+def is_metrics_client(request):
+    """Клиент с токеном `METRICS_TOKEN` или из `METRICS_ALLOWED_NETWORKS`."""
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network)
+               for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """Отдаёт метрики в текстовом формате Prometheus.
+
+    Доступна только клиентам из `is_metrics_client`, остальным
+    отвечает 404. Под gunicorn каждый воркер пишет метрики в свои
+    mmap-файлы в `PROMETHEUS_MULTIPROC_DIR`, здесь они суммируются.
+    """
+    if not is_metrics_client(request):
+        raise Http404
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry),
+                        content_type=CONTENT_TYPE_LATEST)
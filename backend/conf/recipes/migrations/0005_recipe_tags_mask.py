@@ -0,0 +1,34 @@
+# Generated by Django 3.2.19 on 2026-10-18 04:33
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+TAGS_BITMASK_SIZE = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    recipe = apps.get_model('recipes', 'Recipe')
+    masks = defaultdict(int)
+    for recipe_id, tag_id in recipe.tags.through.objects.filter(
+            tag_id__lte=TAGS_BITMASK_SIZE
+    ).values_list('recipe_id', 'tag_id').iterator():
+        masks[recipe_id] |= 1 << (tag_id - 1)
+    for recipe_id, mask in masks.items():
+        recipe.objects.filter(pk=recipe_id).update(tags_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_unique_favourite_subscription'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тэгов'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.19 on 2026-10-18 04:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    user = apps.get_model('users', 'User')
+    recipe = apps.get_model('recipes', 'Recipe')
+    favourite = apps.get_model('recipes', 'Favourite')
+    subscription = apps.get_model('recipes', 'Subscription')
+
+    def count(model, field):
+        return Coalesce(Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field).annotate(total=Count('pk')).values('total')
+        ), 0)
+
+    user.objects.update(
+        recipes_count=count(recipe, 'author'),
+        subscribers_count=count(subscription, 'subscriptions'),
+    )
+    recipe.objects.update(favorites_count=count(favourite, 'recipe'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_tags_mask'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном у'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.19 on 2026-10-18 06:10
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    ingredient = apps.get_model('recipes', 'Ingredient')
+    amount = apps.get_model('recipes', 'IngredientWithQuantity')
+    duplicates = ingredient.objects.values('name', 'measurement_unit').annotate(
+        keep_id=Min('id'), rows=Count('id')).filter(rows__gt=1)
+    for duplicate in duplicates:
+        extra = ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=duplicate['keep_id'])
+        amount.objects.filter(ingredient__in=extra).update(
+            ingredient_id=duplicate['keep_id'])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
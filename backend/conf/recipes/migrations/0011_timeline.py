@@ -0,0 +1,74 @@
+# Generated by Django 3.2.19 on 2026-10-18 05:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    Timeline = apps.get_model('recipes', 'Timeline')
+    Subscription = apps.get_model('recipes', 'Subscription')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    schema_editor.execute(
+        f'INSERT INTO {Timeline._meta.db_table} '
+        '(user_id, recipe_id, author_id) '
+        f'SELECT s.user_id, r.id, r.author_id '
+        f'FROM {Subscription._meta.db_table} s '
+        'JOIN (SELECT id, author_id, ROW_NUMBER() OVER ('
+        'PARTITION BY author_id ORDER BY id DESC) AS position '
+        f'FROM {Recipe._meta.db_table}) r '
+        'ON r.author_id = s.subscriptions_id '
+        f'JOIN {User._meta.db_table} u ON u.id = s.subscriptions_id '
+        'WHERE u.subscribers_count < %s AND r.position <= %s',
+        [settings.TIMELINE_FANOUT_MAX_SUBSCRIBERS,
+         settings.TIMELINE_BACKFILL])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_recipe_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Timeline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'ЛентаПодписок',
+                'verbose_name_plural': 'ЛентыПодписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='timeline',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AddField(
+            model_name='timeline',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='timeline',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timeline',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.19 on 2026-10-18 05:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    ShoppingCard = apps.get_model('recipes', 'ShoppingCard')
+    IngredientWithQuantity = apps.get_model(
+        'recipes', 'IngredientWithQuantity')
+    through = ShoppingCard._meta.get_field('recipes').remote_field.through
+    schema_editor.execute(
+        f'INSERT INTO {ShoppingListItem._meta.db_table} '
+        '(user_id, ingredient_id, total_amount) '
+        'SELECT c.user_id, i.ingredient_id, SUM(i.amount) '
+        f'FROM {ShoppingCard._meta.db_table} c '
+        f'JOIN {through._meta.db_table} t ON t.shoppingcard_id = c.id '
+        f'JOIN {IngredientWithQuantity._meta.db_table} i '
+        'ON i.recipe_id = t.recipe_id '
+        'GROUP BY c.user_id, i.ingredient_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0011_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'ПозицияСпискаПокупок',
+                'verbose_name_plural': 'ПозицииСпискаПокупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
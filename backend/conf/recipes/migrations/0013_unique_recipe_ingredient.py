@@ -0,0 +1,48 @@
+# Generated by Django 3.2.19 on 2026-10-18 09:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+MAX_AMOUNT = 32767
+
+
+def merge_duplicates(apps, schema_editor):
+    """Сливает повторы ингредиента в рецепте в одну строку с суммой.
+
+    Сумма, которая не помещается в поле, останавливает миграцию:
+    обрезка разошлась бы с итогами списков покупок. Такие рецепты
+    нужно исправить вручную. Итоги не меняются, но после миграции
+    их стоит сверить командой `rebuild_shopping_lists`.
+    """
+    amount = apps.get_model('recipes', 'IngredientWithQuantity')
+    duplicates = list(amount.objects.values('recipe', 'ingredient').annotate(
+        keep_id=Min('id'), rows=Count('id'), total=Sum('amount')
+    ).filter(rows__gt=1))
+    too_large = [(duplicate['recipe'], duplicate['ingredient'])
+                 for duplicate in duplicates
+                 if duplicate['total'] > MAX_AMOUNT]
+    if too_large:
+        raise ValueError(
+            f'Сумма повторов больше {MAX_AMOUNT} (рецепт, ингредиент): '
+            f'{too_large}')
+    for duplicate in duplicates:
+        amount.objects.filter(
+            recipe=duplicate['recipe'], ingredient=duplicate['ingredient']
+        ).exclude(id=duplicate['keep_id']).delete()
+        amount.objects.filter(id=duplicate['keep_id']).update(
+            amount=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredientwithquantity',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.19 on 2026-10-18 09:52
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_unique_recipe_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stalesimilarity',
+            name='marked',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Отмечен'),
+        ),
+    ]
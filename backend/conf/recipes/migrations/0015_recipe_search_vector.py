@@ -0,0 +1,109 @@
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce({row}name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce({row}text, '')), 'B')"
+)
+
+
+def use_search_trigger(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS '
+            'search_vector tsvector')
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe ALTER COLUMN search_vector '
+            'DROP EXPRESSION IF EXISTS')
+        schema_editor.execute(
+            'CREATE OR REPLACE FUNCTION recipes_recipe_search_vector() '
+            'RETURNS trigger AS $$ BEGIN '
+            f"NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')}; "
+            'RETURN NEW; END $$ LANGUAGE plpgsql')
+        schema_editor.execute(
+            'CREATE TRIGGER recipes_recipe_search_vector '
+            'BEFORE INSERT OR UPDATE OF name, text, search_vector '
+            'ON recipes_recipe FOR EACH ROW '
+            'EXECUTE FUNCTION recipes_recipe_search_vector()')
+        schema_editor.execute(
+            'UPDATE recipes_recipe SET search_vector = '
+            f"{SEARCH_VECTOR.format(row='')} WHERE search_vector IS NULL")
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector '
+            'ON recipes_recipe USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe ADD COLUMN search_vector text NULL')
+
+
+def use_generated_column(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP TRIGGER IF EXISTS recipes_recipe_search_vector '
+            'ON recipes_recipe')
+        schema_editor.execute(
+            'DROP FUNCTION IF EXISTS recipes_recipe_search_vector()')
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipes_recipe_search_vector')
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe DROP COLUMN search_vector')
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector '
+            f"GENERATED ALWAYS AS ({SEARCH_VECTOR.format(row='')}) STORED")
+        schema_editor.execute(
+            'CREATE INDEX recipes_recipe_search_vector '
+            'ON recipes_recipe USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe DROP COLUMN search_vector')
+
+
+class Migration(migrations.Migration):
+    """Столбец `search_vector` из 0009 становится полем модели.
+
+    Сгенерированный столбец не принимает значений, а Django пишет
+    все поля модели при сохранении, поэтому он заменяется обычным,
+    который заполняет триггер. На SQLite столбец пустой: поиск идёт
+    по таблице FTS5.
+    """
+
+    dependencies = [
+        ('recipes', '0014_stale_similarity_marked'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(use_search_trigger,
+                                     use_generated_column),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='recipe',
+                    name='search_vector',
+                    field=django.contrib.postgres.search.SearchVectorField(
+                        editable=False, null=True,
+                        verbose_name='Поисковый вектор'),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeSearchEntry',
+            fields=[
+                ('recipe', models.OneToOneField(
+                    db_column='rowid', db_constraint=False,
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    primary_key=True, related_name='search_entry',
+                    serialize=False, to='recipes.recipe')),
+                ('name', models.CharField(max_length=255)),
+                ('text', models.TextField()),
+            ],
+            options={
+                'db_table': 'recipes_recipe_fts',
+                'managed': False,
+            },
+        ),
+    ]
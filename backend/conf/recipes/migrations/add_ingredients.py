@@ -1,19 +1,42 @@
+import json
 import os
+from itertools import islice
 
+from django.conf import settings
 from django.db import migrations
-from rest_framework.utils import json
+
+BATCH_SIZE = 1000
+
+
+def read_ingredients(path):
+    """Копия `recipes.loader.read_ingredients` на момент миграции:
+    пары (название, единица) из JSON-массива без повторов."""
+    seen = set()
+    with open(path, encoding='utf-8') as file:
+        for item in json.load(file):
+            key = (item['name'].strip(), item['measurement_unit'].strip())
+            if all(key) and key not in seen:
+                seen.add(key)
+                yield key
 
 
 def add_ingredients(apps, schema_editor):
     ingredient = apps.get_model('recipes', 'Ingredient')
-    path = os.path.join(os.path.dirname(__file__), 'ingredients.json')
-    with open(path, 'r') as file:
-        data = json.load(file)
-        for item in data:
-            ingredient.objects.create(
-                name=item['name'],
-                measurement_unit=item['measurement_unit']
-            )
+    manager = ingredient.objects.using(schema_editor.connection.alias)
+    for path in (os.path.join(os.path.dirname(__file__), 'ingredients.json'),
+                 os.path.join(settings.CATALOGUE_DATA_DIR,
+                              'ingredients.json')):
+        if not os.path.isfile(path):
+            continue
+        rows = read_ingredients(path)
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                return
+            manager.bulk_create(
+                [ingredient(name=name, measurement_unit=unit)
+                 for name, unit in batch],
+                batch_size=BATCH_SIZE, ignore_conflicts=True)
 
 
 class Migration(migrations.Migration):
@@ -22,4 +45,4 @@ class Migration(migrations.Migration):
     ]
     operations = [
         migrations.RunPython(add_ingredients),
-    ]
\ No newline at end of file
+    ]
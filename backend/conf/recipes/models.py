@@ -1,12 +1,28 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import RegexValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
+TAGS_BITMASK_SIZE = 63
+
 hex_validator = RegexValidator(regex=r'^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$',
                                message='Введите корректное hex-значение.')
 
 
+def tags_bitmask(tag_ids):
+    """Битовая маска тегов для `Recipe.tags_mask`.
+
+    В маску попадают только теги с id не больше `TAGS_BITMASK_SIZE`.
+    """
+    mask = 0
+    for tag_id in tag_ids:
+        if tag_id <= TAGS_BITMASK_SIZE:
+            mask |= 1 << (tag_id - 1)
+    return mask
+
+
 class Tag(models.Model):
     """Модель тега."""
 
@@ -43,6 +59,10 @@ class Ingredient(models.Model):
         app_label = 'recipes'
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient'),
+        ]
 
 
 class IngredientWithQuantity(models.Model):
@@ -68,6 +88,10 @@ class IngredientWithQuantity(models.Model):
         app_label = 'recipes'
         verbose_name = 'ИнгредиентСКоличеством'
         verbose_name_plural = 'ИнгредиентыСКоличеством'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'ingredient'],
+                                    name='unique_recipe_ingredient'),
+        ]
 
 
 class Recipe(models.Model):
@@ -77,6 +101,9 @@ class Recipe(models.Model):
                             verbose_name='Имя')
     image = models.ImageField(upload_to='recipe/', blank=False, null=False,
                               verbose_name='Картинка')
+    image_variants = models.JSONField(default=dict, blank=True,
+                                      editable=False,
+                                      verbose_name='Варианты картинки')
     text = models.TextField(blank=False, null=False, verbose_name='Текст')
     cooking_time = models.IntegerField(blank=False, null=False,
                                        verbose_name='Время готовки',
@@ -90,6 +117,12 @@ class Recipe(models.Model):
                                          verbose_name='Ингредиенты')
     tags = models.ManyToManyField(Tag, related_name='tags',
                                   blank=False, verbose_name='Тэги')
+    tags_mask = models.BigIntegerField(default=0, editable=False,
+                                       verbose_name='Маска тэгов')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном у')
+    search_vector = SearchVectorField(null=True, editable=False,
+                                      verbose_name='Поисковый вектор')
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='recipe_set',
                                verbose_name='Автор')
@@ -101,6 +134,30 @@ class Recipe(models.Model):
         app_label = 'recipes'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_id_idx'),
+        ]
+
+
+class RecipeSearchEntry(models.Model):
+    """Запись рецепта в таблице FTS5, по которой ищут на SQLite.
+
+    Таблицу создаёт миграция 0009, записи ведёт `recipes.search`.
+    Модель нужна, чтобы присоединять таблицу к запросам рецептов.
+    """
+
+    recipe = models.OneToOneField(Recipe, on_delete=models.DO_NOTHING,
+                                  primary_key=True, db_column='rowid',
+                                  db_constraint=False,
+                                  related_name='search_entry')
+    name = models.CharField(max_length=255)
+    text = models.TextField()
+
+    class Meta:
+        app_label = 'recipes'
+        managed = False
+        db_table = 'recipes_recipe_fts'
 
 
 class Favourite(models.Model):
@@ -120,6 +177,10 @@ class Favourite(models.Model):
         app_label = 'recipes'
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_favourite'),
+        ]
 
 
 class Subscription(models.Model):
@@ -142,6 +203,10 @@ class Subscription(models.Model):
         app_label = 'recipes'
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'subscriptions'],
+                                    name='unique_subscription'),
+        ]
 
 
 class ShoppingCard(models.Model):
@@ -162,3 +227,94 @@ class ShoppingCard(models.Model):
         app_label = 'recipes'
         verbose_name = 'СписокПокупок'
         verbose_name_plural = 'СпискиПокупок'
+
+
+class RecipeSimilarity(models.Model):
+    """Похожий рецепт по совместному добавлению в избранное."""
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='similarities',
+                               verbose_name='Рецепт')
+    similar = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                                related_name='+',
+                                verbose_name='Похожий рецепт')
+    score = models.FloatField(verbose_name='Сходство')
+
+    def __str__(self):
+        return f'{self.recipe_id} - {self.similar_id}: {self.score:.3f}'
+
+    class Meta:
+        app_label = 'recipes'
+        verbose_name = 'ПохожийРецепт'
+        verbose_name_plural = 'ПохожиеРецепты'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'similar'],
+                                    name='unique_recipe_similarity'),
+        ]
+
+
+class StaleSimilarity(models.Model):
+    """Рецепт, избранное которого изменилось после расчёта похожих."""
+
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  primary_key=True, related_name='+',
+                                  verbose_name='Рецепт')
+    marked = models.DateTimeField(default=timezone.now,
+                                  verbose_name='Отмечен')
+
+    class Meta:
+        app_label = 'recipes'
+        verbose_name = 'УстаревшееСходство'
+        verbose_name_plural = 'УстаревшиеСходства'
+
+
+class Timeline(models.Model):
+    """Рецепт в ленте подписчика его автора."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline',
+                             verbose_name='Пользователь')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='+', verbose_name='Рецепт')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='+', verbose_name='Автор')
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+    class Meta:
+        app_label = 'recipes'
+        verbose_name = 'ЛентаПодписок'
+        verbose_name_plural = 'ЛентыПодписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_timeline'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+
+class ShoppingListItem(models.Model):
+    """Итог по ингредиенту в списке покупок пользователя."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='shopping_list',
+                             verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='+',
+                                   verbose_name='Ингредиент')
+    total_amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    def __str__(self):
+        return f'{self.user_id}: {self.ingredient_id} - {self.total_amount}'
+
+    class Meta:
+        app_label = 'recipes'
+        verbose_name = 'ПозицияСпискаПокупок'
+        verbose_name_plural = 'ПозицииСпискаПокупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item'),
+        ]
@@ -0,0 +1,150 @@
+import json
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """Оценка числа строк запроса по статистике планировщика Postgres.
+
+    Для других СУБД возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class ProbedPage(Page):
+    """Страница, о следующей странице которой известно по лишней
+    строке выборки."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self.next_exists = has_next
+
+    def has_next(self):
+        return self.next_exists
+
+
+class ApproximateCountPaginator(Paginator):
+    """Пагинатор, считающий большие выборки приблизительно.
+
+    Страница выбирается с одной лишней строкой: по ней определяется,
+    есть ли следующая, без COUNT(*). На последней странице число строк
+    известно точно. В остальных случаях точный COUNT(*) выполняется,
+    только если оценка планировщика меньше
+    `APPROXIMATE_COUNT_THRESHOLD`, — оценка идёт только в ответ.
+    """
+
+    def validate_number(self, number):
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            return super().validate_number(number)
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('На этой странице нет результатов')
+        has_next = len(rows) > self.per_page
+        if not has_next:
+            self.__dict__['count'] = bottom + len(rows)
+        return ProbedPage(rows[:self.per_page], number, self, has_next)
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            estimate = estimate_count(self.object_list)
+            if (estimate is not None
+                    and estimate >= settings.APPROXIMATE_COUNT_THRESHOLD):
+                return estimate
+        return super().count
+
+
+class KeysetPagination(CursorPagination):
+    ordering = '-id'
+
+
+class FeedPagination(PageNumberPagination):
+    """Пагинация лент рецептов и подписок.
+
+    По умолчанию постраничная. Если в запросе есть параметр `cursor`
+    (в том числе пустой), выдача идёт по ключу `-id` без OFFSET и COUNT.
+    С параметрами из `ranked_query_params` выдача упорядочена
+    по релевантности, и курсор не применяется.
+
+    Общее число строк может быть оценкой, но номер страницы и ссылка
+    на следующую от неё не зависят.
+    """
+
+    django_paginator_class = ApproximateCountPaginator
+    cursor_query_param = 'cursor'
+    ranked_query_params = ('search',)
+    cursor_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params and not any(
+                request.query_params.get(param, '').strip()
+                for param in self.ranked_query_params):
+            self.cursor_pagination = KeysetPagination()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class TimelinePagination(BasePagination):
+    """Пагинация ленты по ключу. Курсор — id последнего рецепта
+    страницы, следующая начинается с рецептов с меньшим id."""
+
+    cursor_query_param = 'cursor'
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+    def paginate_ids(self, load, request):
+        """Страница id из `load(before, limit)`."""
+        self.request = request
+        before = request.query_params.get(self.cursor_query_param)
+        try:
+            before = int(before) if before else None
+        except ValueError:
+            raise NotFound('Неверный курсор')
+        ids = load(before, self.page_size + 1)
+        self.next_cursor = None
+        if len(ids) > self.page_size:
+            ids = ids[:self.page_size]
+            self.next_cursor = ids[-1]
+        return ids
+
+    def get_paginated_response(self, data):
+        next_link = None
+        if self.next_cursor is not None:
+            next_link = replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param,
+                self.next_cursor)
+        return Response({'next': next_link, 'previous': None,
+                         'results': data})
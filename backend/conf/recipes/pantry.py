@@ -0,0 +1,173 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from recipes import catalogue
+from recipes.models import IngredientWithQuantity
+
+CATALOGUE = 'pantry'
+
+_index = None
+_lock = threading.Lock()
+
+
+class PantryIndex:
+    """Инвертированный индекс «ингредиент → рецепты» в памяти процесса.
+
+    Рецепты занимают плотные позиции в массивах numpy, для каждого
+    ингредиента хранится отсортированный массив позиций рецептов.
+    Подбор по набору ингредиентов сводится к сложению счётчиков
+    по этим массивам и сравнению с общим числом ингредиентов рецепта.
+
+    Удалённый или изменённый рецепт оставляет в массивах мёртвую
+    позицию с нулевым числом ингредиентов, а изменённый получает новую
+    в конце. Когда мёртвых позиций становится больше четверти, массивы
+    уплотняются.
+    """
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.built = time.monotonic()
+        pairs = np.unique(
+            np.array(list(rows), dtype=np.int64).reshape(-1, 2), axis=0)
+        recipe_ids = np.unique(pairs[:, 0])
+        self.size = len(recipe_ids)
+        self.dead = 0
+        self.ids = recipe_ids
+        self.positions = {int(pk): position
+                          for position, pk in enumerate(recipe_ids)}
+        recipe_positions = np.searchsorted(recipe_ids, pairs[:, 0])
+        self.totals = np.bincount(recipe_positions,
+                                  minlength=self.size).astype(np.int32)
+        order = np.lexsort((recipe_positions, pairs[:, 1]))
+        ingredients = pairs[order, 1]
+        recipe_positions = recipe_positions[order]
+        keys, starts = np.unique(ingredients, return_index=True)
+        self.postings = {
+            int(key): np.unique(part) for key, part in zip(
+                keys, np.split(recipe_positions, starts[1:]))
+        }
+
+    def _grow(self):
+        capacity = max(16, len(self.ids) * 2)
+        self.ids = np.resize(self.ids, capacity)
+        self.totals = np.resize(self.totals, capacity)
+        self.totals[self.size:] = 0
+
+    def _compact(self):
+        alive = np.flatnonzero(self.totals[:self.size])
+        renumber = np.full(self.size, -1, dtype=np.int64)
+        renumber[alive] = np.arange(len(alive))
+        postings = {}
+        for key, posting in self.postings.items():
+            posting = renumber[posting]
+            posting = posting[posting >= 0]
+            if len(posting):
+                postings[key] = posting
+        self.postings = postings
+        self.ids = self.ids[alive]
+        self.totals = self.totals[alive]
+        self.size = len(alive)
+        self.dead = 0
+        self.positions = {int(pk): position
+                          for position, pk in enumerate(self.ids)}
+
+    def remove_recipe(self, recipe_id):
+        position = self.positions.pop(recipe_id, None)
+        if position is None:
+            return
+        self.totals[position] = 0
+        self.dead += 1
+        if self.dead * 4 > self.size:
+            self._compact()
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        """Заменяет ингредиенты рецепта в индексе."""
+        self.remove_recipe(recipe_id)
+        ingredient_ids = set(ingredient_ids)
+        if not ingredient_ids:
+            return
+        if self.size == len(self.ids):
+            self._grow()
+        position = self.size
+        self.size += 1
+        self.positions[recipe_id] = position
+        self.ids[position] = recipe_id
+        self.totals[position] = len(ingredient_ids)
+        for key in ingredient_ids:
+            posting = self.postings.get(key, np.empty(0, dtype=np.int64))
+            self.postings[key] = np.append(posting, position)
+
+    def match(self, ingredient_ids, max_missing=None):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Возвращает массивы id рецептов и числа недостающих
+        ингредиентов: сначала рецепты, которые можно приготовить
+        целиком, затем с одним недостающим и так далее.
+        """
+        counts = np.zeros(self.size, dtype=np.int32)
+        for key in set(ingredient_ids):
+            posting = self.postings.get(key)
+            if posting is not None:
+                counts[posting] += 1
+        candidates = np.flatnonzero(counts)
+        candidates = candidates[self.totals[candidates] > 0]
+        missing = self.totals[candidates] - counts[candidates]
+        if max_missing is not None:
+            keep = missing <= max_missing
+            candidates, missing = candidates[keep], missing[keep]
+        recipe_ids = self.ids[candidates]
+        order = np.lexsort((-recipe_ids, missing))
+        return recipe_ids[order], missing[order]
+
+
+def _load(version):
+    return PantryIndex(
+        IngredientWithQuantity.objects.values_list(
+            'recipe_id', 'ingredient_id').iterator(chunk_size=10000),
+        version)
+
+
+def get_pantry_index():
+    """Индекс процесса. Если другой процесс изменил рецепты, индекс
+    перестраивается, но не чаще раза в `PANTRY_INDEX_REFRESH` секунд."""
+    global _index
+    version = catalogue.get_version(CATALOGUE)
+    with _lock:
+        if _index is None or (
+                _index.version != version
+                and time.monotonic() - _index.built
+                >= settings.PANTRY_INDEX_REFRESH):
+            _index = _load(version)
+        return _index
+
+
+def _update(change):
+    """Применяет изменение к индексу процесса и сообщает остальным
+    процессам о новой версии.
+
+    Индекс получает эту версию, только если до изменения он был
+    актуален. Иначе в нём нет чужих изменений, и он остаётся
+    со старой версией, чтобы `get_pantry_index` перестроил его.
+    """
+    previous = catalogue.get_version(CATALOGUE)
+    version = catalogue.invalidate(CATALOGUE)
+    with _lock:
+        if _index is None:
+            return
+        change(_index)
+        if _index.version == previous:
+            _index.version = version
+
+
+def refresh_recipe(recipe_id):
+    """Переносит в индекс текущие ингредиенты рецепта."""
+    ingredient_ids = list(IngredientWithQuantity.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', flat=True))
+    _update(lambda index: index.set_recipe(recipe_id, ingredient_ids))
+
+
+def forget_recipe(recipe_id):
+    _update(lambda index: index.remove_recipe(recipe_id))
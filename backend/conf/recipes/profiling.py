@@ -0,0 +1,178 @@
+import cProfile
+import contextlib
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+from django.utils import timezone
+from django.utils.text import slugify
+
+from recipes.catalogue import LRUCache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+SIGNING_SALT = 'recipes.profiling'
+CAPTURE_NAME = re.compile(r'^[\w.-]+\.(prof|txt)$')
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+_captured = LRUCache(1024)
+
+
+def make_profile_token():
+    """Подписанное значение заголовка `X-Profile`."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def profile_requested(request):
+    """Профилировать ли запрос: по подписанному заголовку или по
+    доле `PROFILE_SAMPLE_RATE`."""
+    token = request.META.get(PROFILE_HEADER)
+    if token:
+        try:
+            signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+                token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+            return True
+        except signing.BadSignature:
+            pass
+    return random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def capture_path(kind, label, seconds, extension):
+    """Путь нового файла захвата; старые сверх `PROFILE_KEEP` удаляются."""
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    captures = list_captures()
+    for capture in captures[settings.PROFILE_KEEP - 1:]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(settings.PROFILE_DIR, capture['name']))
+    name = '{}-{}-{}-{}ms.{}'.format(
+        timezone.now().strftime('%Y%m%dT%H%M%S%f'), kind,
+        slugify(label)[:60] or 'root', int(seconds * 1000), extension)
+    return os.path.join(settings.PROFILE_DIR, name)
+
+
+def list_captures():
+    """Файлы захватов, новые первыми."""
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    captures = []
+    for entry in os.scandir(settings.PROFILE_DIR):
+        if entry.is_file() and CAPTURE_NAME.match(entry.name):
+            stat = entry.stat()
+            captures.append({'name': entry.name, 'size': stat.st_size,
+                             'modified': stat.st_mtime})
+    return sorted(captures, key=lambda capture: capture['modified'],
+                  reverse=True)
+
+
+def get_capture_path(name):
+    """Путь к существующему файлу захвата или None."""
+    if not CAPTURE_NAME.match(name):
+        return None
+    path = os.path.join(settings.PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def redact_plan(plan):
+    """Заменяет строковые литералы плана: в них попадают параметры
+    запроса — ключи токенов, адреса почты."""
+    return STRING_LITERAL.sub("'?'", plan)
+
+
+def should_capture(sql):
+    """Один и тот же запрос разбирается не чаще раза
+    в `SLOW_QUERY_COOLDOWN` секунд в каждом процессе."""
+    fingerprint = hashlib.sha1(sql.encode()).hexdigest()
+    now = time.monotonic()
+    last = _captured.get(fingerprint)
+    if last is not None and now - last < settings.SLOW_QUERY_COOLDOWN:
+        return False
+    _captured.set(fingerprint, now)
+    return True
+
+
+class SlowQueryLogger:
+    """Обёртка `execute_wrapper`, которая для запросов дольше
+    `SLOW_QUERY_SECONDS` пишет в лог их план и сохраняет его в файл.
+
+    По умолчанию план строится без выполнения запроса. EXPLAIN ANALYZE
+    (`SLOW_QUERY_ANALYZE`) выполняет запрос повторно, поэтому разбираются
+    только SELECT. Параметры запроса не сохраняются, а строки в плане
+    скрываются.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.explaining:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = time.perf_counter() - started
+        if (elapsed >= settings.SLOW_QUERY_SECONDS and not many
+                and sql.lstrip()[:6].upper() == 'SELECT'
+                and should_capture(sql)):
+            self.explaining = True
+            try:
+                self.capture(context['connection'], sql, params, elapsed)
+            except Exception:
+                logger.exception('Не удалось получить план запроса')
+            finally:
+                self.explaining = False
+        return result
+
+    def capture(self, db, sql, params, elapsed):
+        if db.vendor != 'postgresql':
+            explain = 'EXPLAIN QUERY PLAN '
+        elif settings.SLOW_QUERY_ANALYZE:
+            explain = 'EXPLAIN (ANALYZE, BUFFERS) '
+        else:
+            explain = 'EXPLAIN '
+        with db.cursor() as cursor:
+            cursor.execute(explain + sql, params)
+            plan = redact_plan('\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()))
+        logger.warning('Медленный запрос %.3f с на %s:\n%s\n%s',
+                       elapsed, self.path, sql, plan)
+        path = capture_path('query', self.path, elapsed, 'txt')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(f'{self.path}\n{elapsed:.3f} s\n\n{sql}\n\n'
+                       f'{plan}\n')
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос через cProfile по подписанному заголовку
+    `X-Profile` или выборочно и сохраняет `.prof` в `PROFILE_DIR`.
+    Медленные SQL-запросы сохраняются с планом всегда.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SLOW_QUERY_SECONDS:
+            return self.handle(request)
+        with connection.execute_wrapper(SlowQueryLogger(request.path)):
+            return self.handle(request)
+
+    def handle(self, request):
+        if not profile_requested(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(self.get_response, request)
+        elapsed = time.perf_counter() - started
+        path = capture_path(request.method.lower(), request.path, elapsed,
+                            'prof')
+        profiler.dump_stats(path)
+        response['X-Profile-Capture'] = os.path.basename(path)
+        return response
@@ -0,0 +1,115 @@
+import csv
+import tempfile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Строки списка отдаются генератором `render_rows`, чтобы ответ можно
+    было передавать клиенту потоком, не собирая файл целиком в памяти.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(self.render_lines(self.error_lines(data)))
+
+    @staticmethod
+    def error_lines(data):
+        if isinstance(data, dict):
+            return [f'{key}: {value}' for key, value in data.items()]
+        return [str(data)]
+
+    @staticmethod
+    def format_row(row):
+        return (f"{row['ingredient__name']} "
+                f"({row['ingredient__measurement_unit']}) - {row['amount']}")
+
+    def render_rows(self, rows):
+        return self.render_lines(self.format_row(row) for row in rows)
+
+    def render_lines(self, lines):
+        for line in lines:
+            yield f'{line}\n'.encode(self.charset)
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в виде текстового файла."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class _Echo:
+    """Буфер, возвращающий записанную строку вместо её хранения."""
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в формате CSV."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render_rows(self, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(
+            ['name', 'measurement_unit', 'amount']).encode(self.charset)
+        for row in rows:
+            yield writer.writerow([
+                row['ingredient__name'],
+                row['ingredient__measurement_unit'],
+                row['amount'],
+            ]).encode(self.charset)
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в формате PDF.
+
+    Документ пишется во временный файл, который при превышении
+    `SHOPPING_LIST_PDF_SPOOL_SIZE` байт сбрасывается на диск,
+    и затем отдаётся частями.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    margin = 40
+    chunk_size = 64 * 1024
+
+    def render_lines(self, lines):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT))
+        with tempfile.SpooledTemporaryFile(
+                max_size=settings.SHOPPING_LIST_PDF_SPOOL_SIZE) as file:
+            document = canvas.Canvas(file, pagesize=A4)
+            width, height = A4
+            leading = self.font_size * 1.5
+            y = height - self.margin
+            document.setFont(self.font_name, self.font_size)
+            for line in lines:
+                if y < self.margin:
+                    document.showPage()
+                    document.setFont(self.font_name, self.font_size)
+                    y = height - self.margin
+                document.drawString(self.margin, y, line)
+                y -= leading
+            document.save()
+            file.seek(0)
+            while True:
+                chunk = file.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
@@ -0,0 +1,169 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import (BooleanField, Case, F, FloatField, IntegerField,
+                              Value, When)
+from django.db.models.expressions import RawSQL
+
+from recipes import catalogue
+from recipes.models import RecipeSearchEntry
+
+NGRAM_SIZE = 3
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = RecipeSearchEntry._meta.db_table
+
+_index = None
+
+
+class IngredientSearchIndex:
+    """Поисковый индекс ингредиентов в памяти процесса.
+
+    Используется вместо триграммного индекса Postgres на SQLite
+    и в тестах. Совпадения по началу названия ищутся в отсортированном
+    массиве, совпадения по подстроке — через словарь n-грамм.
+    """
+
+    def __init__(self, ingredients):
+        self.names = {}
+        grams = defaultdict(set)
+        for pk, name in ingredients:
+            name = name.lower()
+            self.names[pk] = name
+            for size in range(1, NGRAM_SIZE + 1):
+                for start in range(len(name) - size + 1):
+                    grams[name[start:start + size]].add(pk)
+        self.sorted_names = sorted(
+            (name, pk) for pk, name in self.names.items())
+        self.grams = dict(grams)
+
+    def prefix(self, query):
+        position = bisect_left(self.sorted_names, (query,))
+        result = []
+        for name, pk in self.sorted_names[position:]:
+            if not name.startswith(query):
+                break
+            result.append(pk)
+        return result
+
+    def substring(self, query):
+        if len(query) <= NGRAM_SIZE:
+            return set(self.grams.get(query, ()))
+        postings = [self.grams.get(query[start:start + NGRAM_SIZE], set())
+                    for start in range(len(query) - NGRAM_SIZE + 1)]
+        candidates = set.intersection(*sorted(postings, key=len))
+        return {pk for pk in candidates if query in self.names[pk]}
+
+    def search(self, query):
+        """Возвращает id ингредиентов по началу и по подстроке названия."""
+        query = query.lower()
+        prefix_ids = self.prefix(query)
+        substring_ids = self.substring(query).difference(prefix_ids)
+        return prefix_ids, substring_ids
+
+
+def get_ingredient_index():
+    """Возвращает индекс, построенный по текущей версии каталога."""
+    global _index
+    version = catalogue.get_version('ingredients')
+    if _index is None or _index[0] != version:
+        ingredients = catalogue.get_objects('ingredients')
+        _index = (version, IngredientSearchIndex(
+            (pk, ingredient.name) for pk, ingredient in ingredients.items()))
+    return _index[1]
+
+
+def search_ingredients(queryset, value):
+    """Фильтрует ингредиенты по названию.
+
+    Сначала идут ингредиенты, название которых начинается с `value`,
+    затем те, в которых `value` встречается в середине.
+    """
+    if connection.vendor == 'postgresql':
+        return queryset.filter(name__icontains=value).annotate(
+            search_rank=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('search_rank', 'name')
+    prefix_ids, substring_ids = get_ingredient_index().search(value)
+    return queryset.filter(
+        pk__in=[*prefix_ids, *substring_ids]
+    ).annotate(
+        search_rank=Case(
+            When(pk__in=prefix_ids, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('search_rank', 'name')
+
+
+def fts5_query(value):
+    """Запрос FTS5: каждое слово ищется как префикс, что отчасти
+    заменяет русский стемминг, которого в SQLite нет. Однобуквенные
+    предлоги отбрасываются."""
+    words = re.findall(r'\w+', value.lower())
+    words = [word for word in words if len(word) > 1] or words
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск рецептов по названию и тексту.
+
+    На Postgres используется поле `search_vector` с GIN-индексом,
+    которое заполняет триггер, на SQLite — таблица FTS5 и `bm25`.
+    Результаты упорядочены по релевантности, название весит больше
+    текста.
+    """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-id')
+    query = fts5_query(value)
+    if not query:
+        return queryset.none()
+    # bm25 считается только в запросе, где таблица FTS5 присоединена
+    # и отфильтрована MATCH: в подзапросе на каждую строку он заново
+    # проходит все совпадения.
+    return queryset.filter(search_entry__isnull=False).filter(RawSQL(
+        f'{FTS_TABLE} MATCH %s', (query,), output_field=BooleanField(),
+    )).annotate(search_rank=RawSQL(
+        f'-bm25({FTS_TABLE}, 2.0, 1.0)', (), output_field=FloatField(),
+    )).order_by('-search_rank', '-id')
+
+
+def index_recipe(recipe):
+    """Обновляет запись рецепта в таблице FTS5 (только SQLite)."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       (recipe.pk,))
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            'VALUES (%s, %s, %s)', (recipe.pk, recipe.name, recipe.text))
+
+
+def unindex_recipe(recipe_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       (recipe_id,))
+
+
+def rebuild_recipe_index():
+    """Заново заполняет таблицу FTS5 после массовой загрузки рецептов.
+    На Postgres `search_vector` заполняет триггер."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            'SELECT id, name, text FROM recipes_recipe')
@@ -1,30 +1,50 @@
 import base64
-import uuid
-from datetime import datetime
-
-from django.core.files.base import ContentFile
-from django.db import transaction
+import binascii
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
+from PIL import Image, UnidentifiedImageError
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import ValidationError
 
+from recipes import catalogue, shopping
 from recipes.models import (Tag, Ingredient, Recipe, IngredientWithQuantity,
                             Favourite, ShoppingCard, Subscription)
 from users.models import User
 
 
+def get_image_variant_urls(variants):
+    if isinstance(variants, str):
+        variants = json.loads(variants)
+    return {variant: default_storage.url(name)
+            for variant, name in (variants or {}).items()}
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта."""
 
     image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     def get_image(self, obj):
         if isinstance(obj, dict):
             return '/media/' + obj['image']
 
+    def get_image_variants(self, obj):
+        if isinstance(obj, dict):
+            return get_image_variant_urls(obj.get('image_variants'))
+        return get_image_variant_urls(obj.image_variants)
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class RecipeFavouriteSerializer(serializers.ModelSerializer):
@@ -35,16 +55,25 @@ class RecipeFavouriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
         read_only_fields = fields
 
-    def validate(self, data):
-        if self.context.get('method') == 'POST':
-            if self.context['favourite'].exists():
-                raise ValidationError(
-                    {'error': 'the recipe is already in favorites'})
-            return data
-        if not self.context['favourite'].exists():
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return Favourite.objects.create(
+                    user=self.context['user'],
+                    recipe=self.context['recipe']
+                )
+        except IntegrityError:
+            raise ValidationError(
+                {'error': 'the recipe is already in favorites'})
+
+    def delete(self):
+        deleted, _ = Favourite.objects.filter(
+            user=self.context['user'],
+            recipe=self.context['recipe']
+        ).delete()
+        if not deleted:
             raise ValidationError(
                 {'error': 'the recipe is not in favorites yet'})
-        return data
 
 
 class RecipeShoppingCardSerializer(serializers.ModelSerializer):
@@ -55,18 +84,37 @@ class RecipeShoppingCardSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
         read_only_fields = fields
 
-    def validate(self, data):
-        if self.context.get('method') == 'POST':
-            if self.context['shopping_card'].recipes.filter(
-                    pk=self.context['recipe'].pk).exists():
-                raise ValidationError(
-                    {'error': 'the recipe is already in shopping card'})
-            return data
-        if not self.context['shopping_card'].recipes.filter(
-                pk=self.context['recipe'].pk).exists():
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                shopping.lock_cart(self.context['shopping_card'].pk,
+                                   self.context['recipe'].pk)
+                item = ShoppingCard.recipes.through.objects.create(
+                    shoppingcard=self.context['shopping_card'],
+                    recipe=self.context['recipe']
+                )
+                shopping.recipe_added(self.context['shopping_card'].user_id,
+                                      self.context['recipe'].pk)
+                return item
+        except IntegrityError:
+            raise ValidationError(
+                {'error': 'the recipe is already in shopping card'})
+
+    def delete(self):
+        with transaction.atomic():
+            shopping.lock_cart(self.context['shopping_card'].pk,
+                               self.context['recipe'].pk)
+            deleted, _ = ShoppingCard.recipes.through.objects.filter(
+                shoppingcard=self.context['shopping_card'],
+                recipe=self.context['recipe']
+            ).delete()
+            if deleted:
+                shopping.recipe_removed(
+                    self.context['shopping_card'].user_id,
+                    self.context['recipe'].pk)
+        if not deleted:
             raise ValidationError(
                 {'error': 'the recipe is not in shopping card'})
-        return data
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -89,6 +137,8 @@ class UserResponseSerializer(serializers.ModelSerializer):
             'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         if user.is_authenticated:
             return user.subscription_set.filter(
@@ -98,10 +148,60 @@ class UserResponseSerializer(serializers.ModelSerializer):
         return False
 
 
+def get_recipes_by_author(author_ids, limit):
+    """Последние `limit` рецептов каждого автора одним запросом.
+
+    Возвращает словарь {id автора: [рецепт, ...]}, рецепты — словари
+    с полями `RecipeSerializer`.
+    """
+    if not author_ids:
+        return {}
+    ranked = Recipe.objects.filter(author_id__in=author_ids).annotate(
+        row_number=Window(RowNumber(), partition_by=[F('author_id')],
+                          order_by=F('id').desc())
+    ).values('id', 'name', 'image', 'image_variants', 'cooking_time',
+             'author_id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    recipes = {author_id: [] for author_id in author_ids}
+    with connections[ranked.db].cursor() as cursor:
+        cursor.execute(
+            'SELECT id, name, image, image_variants, cooking_time, '
+            'author_id '
+            f'FROM ({sql}) ranked WHERE row_number <= %s '
+            'ORDER BY author_id, id DESC',
+            [*params, limit]
+        )
+        for (pk, name, image, image_variants, cooking_time,
+             author_id) in cursor.fetchall():
+            recipes[author_id].append({
+                'id': pk,
+                'name': name,
+                'image': image,
+                'image_variants': image_variants,
+                'cooking_time': cooking_time,
+            })
+    return recipes
+
+
+class UserResponseWithRecipesListSerializer(serializers.ListSerializer):
+    """Сериализатор списка подписок.
+
+    Рецепты всех авторов страницы загружаются одним запросом.
+    """
+
+    def to_representation(self, data):
+        users = list(data.all() if hasattr(data, 'all') else data)
+        self.context['recipes_by_author'] = get_recipes_by_author(
+            [user.pk for user in users],
+            int(self.context.get('recipes_limit') or 3)
+        )
+        return super().to_representation(users)
+
+
 class UserResponseWithRecipesSerializer(serializers.ModelSerializer):
     """Сериализатор принадлежности пользователя и рецепта."""
 
-    recipes = RecipeSerializer(source='recipe_set', many=True)
+    recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.BooleanField(default=False)
     recipes_count = serializers.IntegerField()
 
@@ -110,14 +210,14 @@ class UserResponseWithRecipesSerializer(serializers.ModelSerializer):
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
             'is_subscribed', 'recipes', 'recipes_count')
+        list_serializer_class = UserResponseWithRecipesListSerializer
 
-    def to_representation(self, instance):
-        recipes_limit = self.context.get('recipes_limit') or 3
-        recipes = instance.recipe_set.values()[:int(recipes_limit)]
-        serializer = RecipeSerializer(recipes, many=True)
-        representation = super().to_representation(instance)
-        representation['recipes'] = serializer.data
-        return representation
+    def get_recipes(self, obj):
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is None:
+            recipes_by_author = get_recipes_by_author(
+                [obj.pk], int(self.context.get('recipes_limit') or 3))
+        return RecipeSerializer(recipes_by_author[obj.pk], many=True).data
 
 
 class UserResponseWithRecipesWithValidateSerializer(
@@ -133,24 +233,31 @@ class UserResponseWithRecipesWithValidateSerializer(
         read_only_fields = fields
 
     def validate(self, data):
-        if self.context.get('method') == 'POST':
-            if self.context['current_user'] == self.context['user']:
-                raise ValidationError(
-                    {'error': 'it is not possible to subscribe to yourself'})
-            if Subscription.objects.filter(
+        if (self.context.get('method') == 'POST'
+                and self.context['current_user'] == self.context['user']):
+            raise ValidationError(
+                {'error': 'it is not possible to subscribe to yourself'})
+        return data
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return Subscription.objects.create(
                     user=self.context['current_user'],
                     subscriptions=self.context['user']
-            ).exists():
-                raise ValidationError(
-                    {'error': 'it is not possible to subscribe to this user'})
-            return data
-        if not Subscription.objects.filter(
-                user=self.context['current_user'],
-                subscriptions=self.context['user']
-        ).exists():
+                )
+        except IntegrityError:
+            raise ValidationError(
+                {'error': 'it is not possible to subscribe to this user'})
+
+    def delete(self):
+        deleted, _ = Subscription.objects.filter(
+            user=self.context['current_user'],
+            subscriptions=self.context['user']
+        ).delete()
+        if not deleted:
             raise ValidationError(
                 {'error': 'you are not subscribed to this user'})
-        return data
 
 
 class SetPasswordSerializer(serializers.ModelSerializer):
@@ -234,6 +341,26 @@ class IngredientWithQuantitySerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class RecipeResponseListSerializer(serializers.ListSerializer):
+    """Сериализатор списка рецептов.
+
+    Загружает связанные объекты для всей страницы разом,
+    а не отдельными запросами на каждый рецепт.
+    """
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        prefetch_related_objects(
+            recipes,
+            'author',
+            'tags',
+            Prefetch('ingredientwithquantity_set',
+                     queryset=IngredientWithQuantity.objects.select_related(
+                         'ingredient')),
+        )
+        return super().to_representation(recipes)
+
+
 class RecipeResponseSerializer(serializers.ModelSerializer):
     """Сериализатор работы с рецептом."""
 
@@ -242,110 +369,230 @@ class RecipeResponseSerializer(serializers.ModelSerializer):
     ingredients = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time')
+        list_serializer_class = RecipeResponseListSerializer
 
     def get_ingredients(self, obj):
-        recipe_ingredients = IngredientWithQuantity.objects.filter(recipe=obj)
-        serializer = IngredientWithQuantitySerializer(recipe_ingredients,
-                                                      many=True)
+        serializer = IngredientWithQuantitySerializer(
+            obj.ingredientwithquantity_set.all(), many=True)
         return serializer.data
 
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        urls = get_image_variant_urls(obj.image_variants)
+        if request is None:
+            return urls
+        return {variant: request.build_absolute_uri(url)
+                for variant, url in urls.items()}
+
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if self.context['request'].user.is_authenticated:
-            if obj.pk in ShoppingCard.objects.filter(
-                    user=self.context['request'].user
-            ).values_list('recipes__pk', flat=True):
-                return True
+            return ShoppingCard.objects.filter(
+                user=self.context['request'].user, recipes=obj
+            ).exists()
         return False
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if self.context['request'].user.is_authenticated:
-            if obj.pk in Favourite.objects.filter(
-                    user=self.context['request'].user
-            ).values_list('recipe__pk', flat=True):
-                return True
+            return Favourite.objects.filter(
+                user=self.context['request'].user, recipe=obj
+            ).exists()
         return False
 
 
+class CataloguePrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Поле связи, получающее объекты из кэша каталога."""
+
+    def __init__(self, catalogue, **kwargs):
+        self.catalogue = catalogue
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return catalogue.get_objects(self.catalogue)[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class RecipeImageField(serializers.Field):
+    """Картинка рецепта.
+
+    Принимает файл из multipart-запроса (Django сохраняет его во временный
+    файл) или строку `data:image/...;base64,...`, которая декодируется
+    частями во временный файл. Формат проверяется по заголовку картинки
+    без полного декодирования.
+    """
+
+    default_error_messages = {
+        'invalid': 'Upload a valid image.',
+        'too_large': 'Image must not be larger than {max_size} bytes.',
+        'format': 'Image format {image_format} is not supported.',
+    }
+    chunk_size = 64 * 1024
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            image = self.decode_base64(data)
+        elif hasattr(data, 'read') and hasattr(data, 'size'):
+            image = data
+        else:
+            self.fail('invalid')
+        try:
+            if image.size > settings.RECIPE_IMAGE_MAX_SIZE:
+                self.fail('too_large',
+                          max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+            image_format = self.get_image_format(image)
+        except ValidationError:
+            if image is not data:
+                image.close()
+            raise
+        # Итоговое имя файла по содержимому задаёт хранилище.
+        image.name = f'image.{image_format.lower()}'
+        return image
+
+    def to_representation(self, value):
+        return value.url if value else None
+
+    def decode_base64(self, data):
+        _, separator, encoded = data.partition(';base64,')
+        if not separator:
+            self.fail('invalid')
+        if len(encoded) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+        file = tempfile.TemporaryFile()
+        try:
+            for start in range(0, len(encoded), self.chunk_size):
+                file.write(base64.b64decode(
+                    encoded[start:start + self.chunk_size], validate=True))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid')
+        file.seek(0)
+        return File(file, name='upload')
+
+    def get_image_format(self, image):
+        image.seek(0)
+        try:
+            with Image.open(image) as picture:
+                image_format = picture.format
+                width, height = picture.size
+        except (UnidentifiedImageError, OSError):
+            self.fail('invalid')
+        finally:
+            image.seek(0)
+        if image_format not in settings.RECIPE_IMAGE_FORMATS:
+            self.fail('format', image_format=image_format)
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail('invalid')
+        return image_format
+
+
 class RecipeResponsePostUpdateSerializer(serializers.ModelSerializer):
     """Сериализатор работы с рецептом."""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Tag.objects.all()
+    tags = CataloguePrimaryKeyRelatedField(
+        'tags', many=True, queryset=Tag.objects.all()
     )
     ingredients = IngredientWithQuantityForRecipeSerializer(many=True)
-    image = serializers.CharField(required=False)
+    image = RecipeImageField(required=False)
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'ingredients', 'name', 'image',
                   'text', 'cooking_time')
 
-    def base_64_to_image(self):
-        if self.validated_data.get('image'):
-            format_image, imgstr = self.validated_data['image'].split(
-                ';base64,')
-            ext = format_image.split('/')[-1]
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            unique_name = (
-                f"{timestamp}_{str(uuid.uuid4())[:8]}"
-            )
-            return ContentFile(
-                base64.b64decode(imgstr),
-                name=f"{unique_name}.{ext}"
-            )
-        return None
+    def validate_ingredients(self, value):
+        ingredients = catalogue.get_objects('ingredients')
+        seen = set()
+        for item in value:
+            pk = item['ingredient']['id']
+            if pk not in ingredients:
+                raise ValidationError(f'ingredient {pk} does not exist')
+            if pk in seen:
+                raise ValidationError(f'ingredient {pk} is duplicated')
+            seen.add(pk)
+        return value
+
+    def save_ingredients(self, recipe, current=()):
+        """Приводит ингредиенты рецепта к переданным в запросе.
+
+        Существующие строки `current` читаются в той же транзакции
+        и сравниваются с новыми по ингредиенту, изменения применяются
+        пакетными удалением, обновлением и вставкой.
+        Возвращает изменения количеств {ингредиент: разница}.
+        """
+        catalogue_ingredients = catalogue.get_objects('ingredients')
+        amounts = {item['ingredient']['id']: item['amount']
+                   for item in self.validated_data['ingredients']}
+        current = {row.ingredient_id: row for row in current}
+        to_create = [IngredientWithQuantity(
+            ingredient=catalogue_ingredients[pk],
+            amount=amount,
+            recipe=recipe
+        ) for pk, amount in amounts.items() if pk not in current]
+        deltas = {pk: amount for pk, amount in amounts.items()
+                  if pk not in current}
+        to_update = []
+        for pk, row in current.items():
+            if pk in amounts and row.amount != amounts[pk]:
+                deltas[pk] = amounts[pk] - row.amount
+                row.amount = amounts[pk]
+                to_update.append(row)
+            elif pk not in amounts:
+                deltas[pk] = -row.amount
+        to_delete = [row.pk for pk, row in current.items()
+                     if pk not in amounts]
+        for ingredient in to_create + to_update:
+            ingredient.clean()
+        if to_delete:
+            IngredientWithQuantity.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            IngredientWithQuantity.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            IngredientWithQuantity.objects.bulk_create(to_create)
+        return deltas
 
     def create(self, validated_data):
-        image = self.base_64_to_image()
-        tags = [Tag.objects.get(pk=tag.pk) for tag in
-                self.validated_data['tags']]
         with transaction.atomic():
             recipe = Recipe.objects.create(
                 author=self.context['request'].user,
                 name=self.validated_data['name'],
                 text=self.validated_data['text'],
-                image=image,
+                image=self.validated_data.get('image'),
                 cooking_time=self.validated_data['cooking_time']
             )
-            recipe.tags.set(tags)
-            recipe.save()
-            ingredients = [IngredientWithQuantity(
-                ingredient=Ingredient.objects.get(pk=item['ingredient']['id']),
-                amount=item['amount'],
-                recipe=recipe
-            ) for item in self.validated_data['ingredients']]
-            for ingredient in ingredients:
-                ingredient.clean()
-            IngredientWithQuantity.objects.bulk_create(ingredients)
+            recipe.tags.set(self.validated_data['tags'])
+            self.save_ingredients(recipe)
         return recipe
 
     def update(self, instance, validated_data):
-        image = self.base_64_to_image()
-        tags = [Tag.objects.get(pk=tag.pk) for tag in
-                self.validated_data['tags']]
+        image = self.validated_data.get('image')
         with transaction.atomic():
+            shopping.lock_recipe(instance.pk)
             instance.name = self.validated_data['name']
             instance.text = self.validated_data['text']
+            update_fields = ['name', 'text', 'cooking_time']
             if image:
                 instance.image = image
+                update_fields.append('image')
             instance.cooking_time = self.validated_data['cooking_time']
-            instance.tags.set(tags)
-            instance.save()
-            for ingredient in IngredientWithQuantity.objects.filter(
-                    recipe=instance):
-                ingredient.delete()
-            ingredients = [IngredientWithQuantity(
-                ingredient=Ingredient.objects.get(pk=item['ingredient']['id']),
-                amount=item['amount'],
-                recipe=instance
-            ) for item in self.validated_data['ingredients']]
-            for ingredient in ingredients:
-                ingredient.clean()
-            IngredientWithQuantity.objects.bulk_create(ingredients)
+            instance.tags.set(self.validated_data['tags'])
+            instance.save(update_fields=update_fields)
+            deltas = self.save_ingredients(
+                instance, shopping.locked_ingredients(instance.pk))
+            shopping.recipe_changed(instance.pk, deltas)
         return instance
@@ -0,0 +1,227 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.shortcuts import get_object_or_404
+
+from recipes.models import (IngredientWithQuantity, Recipe, ShoppingCard,
+                            ShoppingListItem)
+
+CartItem = ShoppingCard.recipes.through
+
+
+def change_totals(user_ids, deltas):
+    """Прибавляет `deltas` {ингредиент: количество} к спискам покупок
+    пользователей. Позиции с нулевым итогом удаляются.
+
+    Вызывается внутри транзакции, которая меняет корзины или рецепт.
+    """
+    user_ids = list(user_ids)
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        by_delta[delta].append(pk)
+    added = [pk for pk, delta in deltas.items() if delta > 0]
+    removed = [pk for pk, delta in deltas.items() if delta < 0]
+    size = settings.SHOPPING_LIST_CHUNK_SIZE
+    with transaction.atomic():
+        for start in range(0, len(user_ids), size):
+            users = user_ids[start:start + size]
+            if added:
+                ShoppingListItem.objects.bulk_create([
+                    ShoppingListItem(user_id=user_id, ingredient_id=pk,
+                                     total_amount=0)
+                    for user_id in users for pk in added
+                ], ignore_conflicts=True)
+            items = ShoppingListItem.objects.filter(user_id__in=users)
+            for delta, ingredient_ids in by_delta.items():
+                items.filter(ingredient_id__in=ingredient_ids).update(
+                    total_amount=Greatest(F('total_amount') + delta, 0))
+            if removed:
+                items.filter(ingredient_id__in=removed,
+                             total_amount=0).delete()
+
+
+def lock_recipe(recipe_id):
+    """Блокирует строку рецепта до конца транзакции.
+
+    Добавление в корзину, удаление из неё, правка и удаление рецепта
+    начинаются с этой блокировки и выполняются по очереди, поэтому
+    разницы считаются по тем же ингредиентам и корзинам, что
+    и записываются.
+    """
+    get_object_or_404(Recipe.objects.select_for_update().only('pk'),
+                      pk=recipe_id)
+
+
+def lock_cart(card_id, recipe_id):
+    """Блокирует корзину, затем рецепт.
+
+    Корзина блокируется первой, как и в `repair`, поэтому изменение
+    корзины и исправление её итогов не ждут друг друга по кругу.
+    """
+    list(ShoppingCard.objects.select_for_update().filter(
+        pk=card_id).values_list('pk', flat=True))
+    lock_recipe(recipe_id)
+
+
+def lock_users(user_ids):
+    """Блокирует корзины пользователей и рецепты в них по возрастанию id.
+
+    Пока блокировки держатся, итоги этих пользователей не меняют
+    ни корзины, ни правки рецептов.
+    """
+    list(ShoppingCard.objects.select_for_update().filter(
+        user_id__in=user_ids).order_by('pk').values_list('pk', flat=True))
+    list(Recipe.objects.select_for_update(of=('self',)).filter(
+        recipes__user_id__in=user_ids).order_by('pk').values_list(
+            'pk', flat=True))
+
+
+def locked_ingredients(recipe_id):
+    """Строки ингредиентов рецепта под блокировкой до конца транзакции.
+
+    Запрос без соединения с каталогом: его строки общие для всех
+    рецептов, и блокировка задерживала бы правки чужих рецептов.
+    """
+    return IngredientWithQuantity.objects.filter(
+        recipe_id=recipe_id).select_for_update(of=('self',))
+
+
+def recipe_amounts(recipe_id):
+    return dict(IngredientWithQuantity.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def recipe_added(user_id, recipe_id):
+    change_totals([user_id], recipe_amounts(recipe_id))
+
+
+def recipe_removed(user_id, recipe_id):
+    change_totals([user_id], {
+        pk: -amount for pk, amount in recipe_amounts(recipe_id).items()})
+
+
+def recipe_changed(recipe_id, deltas):
+    """Переносит изменение ингредиентов рецепта в списки покупок всех,
+    у кого он в корзине."""
+    if not deltas:
+        return
+    change_totals(cart_users(recipe_id), deltas)
+
+
+def recipe_deleted(recipe_id):
+    """Убирает удаляемый рецепт из списков покупок, пока его
+    ингредиенты ещё в базе."""
+    change_totals(cart_users(recipe_id), {
+        pk: -amount for pk, amount in recipe_amounts(recipe_id).items()})
+
+
+def cart_users(recipe_id):
+    return CartItem.objects.filter(recipe_id=recipe_id).values_list(
+        'shoppingcard__user_id', flat=True)
+
+
+def expected_totals(user_ids=None):
+    """Итоги, посчитанные по корзинам, по возрастанию (user, ingredient)."""
+    rows = IngredientWithQuantity.objects.filter(
+        recipe__recipes__isnull=False)
+    if user_ids is not None:
+        rows = rows.filter(recipe__recipes__user_id__in=user_ids)
+    return rows.values_list(
+        'recipe__recipes__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by(
+        'recipe__recipes__user_id', 'ingredient_id').iterator(
+            chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+
+
+def stored_totals(user_ids=None):
+    rows = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=user_ids)
+    return rows.order_by('user_id', 'ingredient_id').values_list(
+        'user_id', 'ingredient_id', 'total_amount').iterator(
+            chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+
+
+def find_drift(user_ids=None):
+    """Расхождения таблицы с корзинами: (пользователь, ингредиент,
+    ожидаемый итог, сохранённый итог), отсутствие — None.
+
+    Оба потока упорядочены одинаково и сливаются без загрузки в память.
+    Потоки читаются без блокировок, поэтому при активных корзинах
+    часть расхождений может оказаться мнимой; их перепроверяет
+    `confirmed_drift`.
+    """
+    expected, stored = expected_totals(user_ids), stored_totals(user_ids)
+    left, right = next(expected, None), next(stored, None)
+    while left is not None or right is not None:
+        if right is None or left is not None and left[:2] < right[:2]:
+            yield left[0], left[1], left[2], None
+            left = next(expected, None)
+        elif left is None or right[:2] < left[:2]:
+            yield right[0], right[1], None, right[2]
+            right = next(stored, None)
+        else:
+            if left[2] != right[2]:
+                yield left[0], left[1], left[2], right[2]
+            left, right = next(expected, None), next(stored, None)
+
+
+def confirmed_drift(user_id):
+    """Расхождения пользователя, перечитанные под `lock_users`.
+
+    Вызывается внутри транзакции, блокировки держатся до её конца.
+    """
+    lock_users([user_id])
+    return list(find_drift([user_id]))
+
+
+def drifted_users():
+    return sorted({row[0] for row in find_drift()})
+
+
+def repair(user_ids):
+    """Исправляет итоги пользователей и возвращает число исправленных
+    позиций.
+
+    Итоги каждого пользователя пересчитываются и записываются в своей
+    транзакции под `lock_users`, поэтому разницы, которые в это время
+    вносят корзины и правки рецептов, не теряются.
+    """
+    count = 0
+    for user_id in user_ids:
+        with transaction.atomic():
+            count += apply_drift(confirmed_drift(user_id))
+    return count
+
+
+def apply_drift(drift):
+    """Записывает ожидаемые итоги из `drift` и возвращает их число.
+
+    Блокировок не берёт: без `repair` вызывается, только когда корзины
+    не меняются, например при генерации данных.
+    """
+    drift = list(drift)
+    missing = defaultdict(list)
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         total_amount=expected)
+        for user_id, ingredient_id, expected, stored in drift
+        if stored is None
+    ], batch_size=settings.SHOPPING_LIST_CHUNK_SIZE)
+    for user_id, ingredient_id, expected, stored in drift:
+        if expected is None:
+            missing[user_id].append(ingredient_id)
+        elif stored is not None:
+            ShoppingListItem.objects.filter(
+                user_id=user_id, ingredient_id=ingredient_id
+            ).update(total_amount=expected)
+    for user_id, ingredient_ids in missing.items():
+        ShoppingListItem.objects.filter(
+            user_id=user_id, ingredient_id__in=ingredient_ids).delete()
+    return len(drift)
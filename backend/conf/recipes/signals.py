@@ -0,0 +1,211 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes import catalogue, shopping, similarity, timeline
+from recipes.images import schedule_variants
+from recipes.models import (Favourite, Ingredient, Recipe, StaleSimilarity,
+                            Subscription, Tag, tags_bitmask)
+from recipes.pantry import forget_recipe, refresh_recipe
+from recipes.search import index_recipe, unindex_recipe
+from users.authentication import invalidate_token, invalidate_user
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(partial(catalogue.invalidate, 'tags'))
+
+
+def remove_tag_from_masks(tag):
+    mask = tags_bitmask([tag.pk])
+    if mask:
+        Recipe.objects.exclude(tags_mask=0).update(
+            tags_mask=F('tags_mask').bitand(~mask))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    remove_tag_from_masks(instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action == 'post_clear':
+        if reverse:
+            remove_tag_from_masks(instance)
+        else:
+            instance.tags_mask = 0
+            Recipe.objects.filter(pk=instance.pk).update(tags_mask=0)
+        return
+    if action not in ('post_add', 'post_remove'):
+        return
+    if reverse:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+        mask = tags_bitmask([instance.pk])
+    else:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+        mask = tags_bitmask(pk_set)
+    if not mask:
+        return
+    if action == 'post_add':
+        recipes.update(tags_mask=F('tags_mask').bitor(mask))
+        if not reverse:
+            instance.tags_mask |= mask
+    else:
+        recipes.update(tags_mask=F('tags_mask').bitand(~mask))
+        if not reverse:
+            instance.tags_mask &= ~mask
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    transaction.on_commit(partial(catalogue.invalidate, 'ingredients'))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, created, update_fields, **kwargs):
+    if not instance.image:
+        return
+    if created or update_fields is None or 'image' in update_fields:
+        transaction.on_commit(partial(
+            schedule_variants, instance.pk, instance.image.name))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_text_saved(sender, instance, created, update_fields, **kwargs):
+    if (created or update_fields is None
+            or {'name', 'text'}.intersection(update_fields)):
+        index_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_unindexed(sender, instance, **kwargs):
+    unindex_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_ingredients_saved(sender, instance, **kwargs):
+    transaction.on_commit(partial(refresh_recipe, instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_ingredients_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(forget_recipe, instance.pk))
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_removed_from_carts(sender, instance, **kwargs):
+    shopping.recipe_deleted(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.author_id, recipes_count__gt=0).update(
+        recipes_count=F('recipes_count') - 1)
+
+
+@receiver(post_save, sender=Favourite)
+def favourite_created(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1)
+
+
+@receiver(post_delete, sender=Favourite)
+def favourite_deleted(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id, favorites_count__gt=0).update(
+        favorites_count=F('favorites_count') - 1)
+
+
+def mark_similarity_stale(recipe_id):
+    """Рецепт попадёт в следующий инкрементальный пересчёт похожих.
+    Если избранное удалено вместе с рецептом, отмечать нечего."""
+    if Recipe.objects.filter(pk=recipe_id).exists():
+        StaleSimilarity.objects.update_or_create(
+            recipe_id=recipe_id, defaults={'marked': timezone.now()})
+
+
+@receiver(post_save, sender=Favourite)
+def favourite_similarity_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            partial(mark_similarity_stale, instance.recipe_id))
+
+
+@receiver(post_delete, sender=Favourite)
+def favourite_similarity_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(mark_similarity_stale, instance.recipe_id))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_similarity_changed(sender, instance, created=False, **kwargs):
+    """Списки похожих хранят название, картинку и время рецептов,
+    поэтому сбрасываются при их правке и удалении."""
+    if not created:
+        transaction.on_commit(
+            partial(catalogue.invalidate, similarity.CATALOGUE))
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created and instance.subscriptions_id:
+        User.objects.filter(pk=instance.subscriptions_id).update(
+            subscribers_count=F('subscribers_count') + 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    if instance.subscriptions_id and User.objects.filter(
+            pk=instance.subscriptions_id, subscribers_count__gt=0
+    ).update(subscribers_count=F('subscribers_count') - 1):
+        timeline.subscriber_removed(instance.subscriptions_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_fan_out(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(
+            timeline.schedule, timeline.recipe_created, instance.pk,
+            instance.author_id))
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_timeline_saved(sender, instance, created, **kwargs):
+    if created and instance.subscriptions_id:
+        transaction.on_commit(partial(
+            timeline.schedule, timeline.subscribed, instance.user_id,
+            instance.subscriptions_id))
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_timeline_deleted(sender, instance, **kwargs):
+    if instance.subscriptions_id:
+        transaction.on_commit(partial(
+            timeline.unsubscribed, instance.user_id,
+            instance.subscriptions_id))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(partial(invalidate_user, instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_token, instance.key))
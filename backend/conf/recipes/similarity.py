@@ -0,0 +1,164 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from scipy import sparse
+
+from recipes import catalogue
+from recipes.models import (Favourite, Recipe, RecipeSimilarity,
+                            StaleSimilarity)
+from recipes.serializers import RecipeSerializer
+
+CATALOGUE = 'similar'
+
+
+def favourites_matrix():
+    """Разреженная матрица «пользователь × рецепт» из избранного.
+
+    Возвращает матрицу в CSR и массив id рецептов по столбцам.
+    """
+    pairs = np.fromiter(
+        (value for pair in Favourite.objects.values_list(
+            'user_id', 'recipe_id').iterator(chunk_size=50000)
+         for value in pair),
+        dtype=np.int64).reshape(-1, 2)
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    recipe_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+        shape=(len(user_ids), len(recipe_ids)))
+    matrix.data[:] = 1
+    return matrix, recipe_ids
+
+
+def stored_thresholds(recipe_ids, top_k):
+    """Наименьшее сохранённое сходство для рецептов с полным списком
+    соседей; у остальных в список попадёт любой новый сосед."""
+    thresholds = np.zeros(len(recipe_ids), dtype=np.float32)
+    rows = RecipeSimilarity.objects.values('recipe_id').annotate(
+        lowest=Min('score'), total=Count('id')).filter(
+            total__gte=top_k).values_list('recipe_id', 'lowest')
+    for recipe_id, lowest in rows.iterator(chunk_size=10000):
+        position = np.searchsorted(recipe_ids, recipe_id)
+        if position < len(recipe_ids) and recipe_ids[position] == recipe_id:
+            thresholds[position] = lowest
+    return thresholds
+
+
+def affected_columns(matrix, recipe_ids, stale_ids, top_k, min_common,
+                     chunk_size):
+    """Столбцы, у которых мог измениться список соседей.
+
+    Это сами устаревшие рецепты, рецепты, у которых устаревший уже
+    в списке, и рецепты, для которых новое сходство с устаревшим
+    не меньше последнего сохранённого соседа.
+    """
+    stale = np.flatnonzero(np.isin(recipe_ids, stale_ids))
+    listed = RecipeSimilarity.objects.filter(
+        similar_id__in=list(stale_ids)).values_list('recipe_id', flat=True)
+    affected = [stale, np.flatnonzero(np.isin(recipe_ids, list(listed)))]
+    thresholds = stored_thresholds(recipe_ids, top_k)
+    for _, neighbours, scores in cosine_rows(matrix, stale, min_common,
+                                             chunk_size):
+        affected.append(neighbours[scores >= thresholds[neighbours] - 1e-6])
+    return np.unique(np.concatenate(affected))
+
+
+def cosine_rows(matrix, columns, min_common, chunk_size):
+    """Косинусное сходство заданных столбцов с остальными.
+
+    Произведение считается частями по `chunk_size` столбцов, поэтому
+    память ограничена размером одной части. Отдаёт столбец, его соседей
+    с не менее чем `min_common` общими пользователями и сходство с ними.
+    """
+    by_recipe = matrix.T.tocsr()
+    norms = np.sqrt(np.asarray(by_recipe.getnnz(axis=1), dtype=np.float32))
+    for start in range(0, len(columns), chunk_size):
+        chunk = columns[start:start + chunk_size]
+        common = (by_recipe[chunk] @ matrix).tocsr()
+        for row, column in enumerate(chunk):
+            begin, end = common.indptr[row], common.indptr[row + 1]
+            neighbours = common.indices[begin:end]
+            counts = common.data[begin:end]
+            keep = (neighbours != column) & (counts >= min_common)
+            neighbours, counts = neighbours[keep], counts[keep]
+            yield column, neighbours, counts / (
+                norms[column] * norms[neighbours])
+
+
+def top_neighbours(matrix, recipe_ids, columns, top_k, min_common,
+                   chunk_size):
+    """Top-K соседей по id рецептов, словарями по `chunk_size`."""
+    result = {}
+    for column, neighbours, scores in cosine_rows(matrix, columns,
+                                                  min_common, chunk_size):
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            neighbours, scores = neighbours[best], scores[best]
+        result[int(recipe_ids[column])] = [
+            (int(recipe_ids[neighbour]), float(score))
+            for neighbour, score in zip(neighbours, scores)]
+        if len(result) >= chunk_size:
+            yield result
+            result = {}
+    if result:
+        yield result
+
+
+def save_neighbours(result):
+    with transaction.atomic():
+        RecipeSimilarity.objects.filter(recipe_id__in=list(result)).delete()
+        RecipeSimilarity.objects.bulk_create(
+            RecipeSimilarity(recipe_id=recipe_id, similar_id=similar_id,
+                             score=score)
+            for recipe_id, neighbours in result.items()
+            for similar_id, score in neighbours)
+
+
+def build_similarities(full=False, top_k=10, min_common=1, chunk_size=2000):
+    """Пересчитывает похожие рецепты и возвращает число обновлённых.
+
+    Без `full` пересчитываются только рецепты, затронутые изменениями
+    избранного с прошлого запуска. Отметки, сделанные во время
+    пересчёта, остаются до следующего запуска.
+    """
+    started = timezone.now()
+    stale_ids = list(StaleSimilarity.objects.values_list(
+        'recipe_id', flat=True))
+    if not full and not stale_ids:
+        return 0
+    matrix, recipe_ids = favourites_matrix()
+    if full:
+        columns = np.arange(len(recipe_ids))
+        RecipeSimilarity.objects.exclude(
+            recipe_id__in=Favourite.objects.values('recipe_id')).delete()
+    else:
+        columns = affected_columns(matrix, recipe_ids, stale_ids, top_k,
+                                   min_common, chunk_size)
+        RecipeSimilarity.objects.filter(recipe_id__in=stale_ids).exclude(
+            recipe_id__in=Favourite.objects.values('recipe_id')).delete()
+    updated = 0
+    for result in top_neighbours(matrix, recipe_ids, columns, top_k,
+                                 min_common, chunk_size):
+        save_neighbours(result)
+        updated += len(result)
+    StaleSimilarity.objects.filter(recipe_id__in=stale_ids,
+                                   marked__lte=started).delete()
+    catalogue.invalidate(CATALOGUE)
+    return updated
+
+
+def similar_recipes(recipe_id):
+    """Краткие данные похожих рецептов со степенью сходства,
+    самые похожие первыми."""
+    scores = dict(RecipeSimilarity.objects.filter(
+        recipe_id=recipe_id).order_by('-score', '-similar_id').values_list(
+            'similar_id', 'score'))
+    recipes = {recipe['id']: recipe for recipe in Recipe.objects.filter(
+        pk__in=list(scores)).values(
+            'id', 'name', 'image', 'image_variants', 'cooking_time')}
+    data = RecipeSerializer(
+        [recipes[pk] for pk in scores if pk in recipes], many=True).data
+    for item in data:
+        item['score'] = round(scores[item['id']], 4)
+    return data
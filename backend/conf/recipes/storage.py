@@ -0,0 +1,64 @@
+import hashlib
+import os
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+
+
+class BlobExists(Exception):
+    pass
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хэш его содержимого.
+
+    Файл сохраняется как `<папка>/<ab>/<sha256><расширение>`.
+    Одинаковые файлы записываются один раз, а их URL никогда
+    не указывает на другое содержимое, поэтому его можно кэшировать
+    навсегда.
+    """
+
+    hash_chunk_size = 64 * 1024
+
+    def blob_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(self.hash_chunk_size):
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(os.path.dirname(name), digest[:2],
+                            f'{digest}{extension}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.blob_name(name, content)
+        if self.touch(name):
+            return name
+        try:
+            return super().save(name, content, max_length=max_length)
+        except BlobExists:
+            self.touch(name)
+            return name
+
+    def touch(self, name):
+        """Обновляет время изменения файла, если он есть.
+
+        Повторно загруженный файл выглядит для `collect_orphan_media`
+        новым, пока ссылка на него ещё не сохранена в рецепте.
+        """
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым: файл с тем же именем уже содержит
+        # те же данные, поэтому подбирать свободное имя не нужно.
+        if self.exists(name):
+            raise BlobExists(name)
+        return name
@@ -0,0 +1,33 @@
+from django.test import SimpleTestCase, TestCase
+
+from recipes import catalogue
+from recipes.checks import check_shared_cache
+from recipes.models import Tag
+
+
+class CatalogueTests(SimpleTestCase):
+
+    def test_invalidate_changes_version(self):
+        version = catalogue.get_version('tags')
+        self.assertEqual(catalogue.get_version('tags'), version)
+        catalogue.invalidate('tags')
+        self.assertNotEqual(catalogue.get_version('tags'), version)
+
+    def test_process_local_cache_is_reported(self):
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_shared_cache(
+                None)], ['recipes.W001'])
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django_redis.cache.RedisCache'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class CatalogueInvalidationTests(TestCase):
+
+    def test_tag_change_invalidates_after_commit(self):
+        version = catalogue.get_version('tags')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+            self.assertEqual(catalogue.get_version('tags'), version)
+        self.assertNotEqual(catalogue.get_version('tags'), version)
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from recipes.counters import rebuild_counters
+from recipes.models import Favourite, Recipe, Subscription
+from users.models import User
+
+
+@override_settings(TIMELINE_WORKERS=0)
+class CounterTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user(
+            'reader', 'reader@example.com', 'password')
+        self.recipe = self.create_recipe()
+
+    def create_recipe(self):
+        return Recipe.objects.create(name='Суп', image='', text='Текст',
+                                     cooking_time=10, author=self.author)
+
+    def counts(self):
+        self.author.refresh_from_db()
+        self.recipe.refresh_from_db()
+        return (self.author.recipes_count, self.author.subscribers_count,
+                self.recipe.favorites_count)
+
+    def test_counters_follow_changes(self):
+        self.assertEqual(self.counts(), (1, 0, 0))
+        favourite = Favourite.objects.create(user=self.reader,
+                                             recipe=self.recipe)
+        subscription = Subscription.objects.create(user=self.reader,
+                                                   subscriptions=self.author)
+        self.create_recipe().delete()
+        self.assertEqual(self.counts(), (1, 1, 1))
+        favourite.delete()
+        subscription.delete()
+        self.assertEqual(self.counts(), (1, 0, 0))
+
+    def test_rolled_back_changes_keep_counters(self):
+        try:
+            with transaction.atomic():
+                Favourite.objects.create(user=self.reader,
+                                         recipe=self.recipe)
+                self.create_recipe()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(self.counts(), (1, 0, 0))
+
+    def test_rebuild_repairs_drift(self):
+        Favourite.objects.create(user=self.reader, recipe=self.recipe)
+        User.objects.filter(pk=self.author.pk).update(
+            recipes_count=5, subscribers_count=3)
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=0)
+        rebuild_counters()
+        self.assertEqual(self.counts(), (1, 0, 1))
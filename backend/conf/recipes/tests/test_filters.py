@@ -0,0 +1,47 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes import catalogue
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+@override_settings(TIMELINE_WORKERS=0, RECIPE_TAGS_SELECTIVE_SHARE=0.2)
+class TagFilterTests(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        common = Tag.objects.create(name='Обед', color='#E26C2D',
+                                    slug='lunch')
+        rare = Tag.objects.create(name='Ужин', color='#8775D2',
+                                  slug='dinner')
+        self.recipes = [Recipe.objects.create(
+            name=f'Суп {number}', image='', text='Текст', cooking_time=10,
+            author=author) for number in range(10)]
+        for recipe in self.recipes[1:]:
+            recipe.tags.add(common)
+        self.recipes[0].tags.add(rare)
+        catalogue.invalidate('tags')
+        self.client = APIClient()
+
+    def filter(self, *slugs):
+        through = Recipe.tags.through._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/', {'tags': slugs})
+        self.assertEqual(response.status_code, 200)
+        indexed = any(through in query['sql'] and 'LIMIT' in query['sql']
+                      for query in queries.captured_queries)
+        return {recipe['id'] for recipe in response.data['results']}, indexed
+
+    def test_common_tag_uses_bitmask(self):
+        ids, indexed = self.filter('lunch')
+        self.assertEqual(ids, {recipe.pk for recipe in self.recipes[4:]})
+        self.assertFalse(indexed)
+
+    def test_rare_tag_uses_index(self):
+        ids, indexed = self.filter('dinner')
+        self.assertEqual(ids, {self.recipes[0].pk})
+        self.assertTrue(indexed)
@@ -0,0 +1,90 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from recipes.models import (Favourite, Recipe, ShoppingCard,
+                            Subscription)
+from users.models import User
+
+
+class GenerateFakeDataTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.overrides = override_settings(MEDIA_ROOT=cls.media_root,
+                                          TIMELINE_WORKERS=0)
+        cls.overrides.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.overrides.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_every_user_gets_a_shopping_card(self):
+        call_command('generate_fake_data', users=30, recipes=20, cart=1,
+                     favourites=2, subscriptions=2, stdout=StringIO())
+        users = User.objects.filter(username__startswith='fake_')
+        self.assertEqual(users.count(), 30)
+        self.assertFalse(users.filter(shoppingcard_set__isnull=True).exists())
+        self.assertTrue(ShoppingCard.objects.filter(
+            user__in=users, recipes__isnull=True).exists())
+
+    def snapshot(self, prefix):
+        """Данные запуска с id, заменёнными на имена и порядковые
+        номера внутри запуска."""
+        start = len(prefix) + 1
+        recipes = list(Recipe.objects.filter(
+            author__username__startswith=f'{prefix}_'
+        ).order_by('id').prefetch_related(
+            'tags', 'ingredientwithquantity_set'))
+        numbers = {recipe.pk: number for number, recipe in enumerate(recipes)}
+        return {
+            'recipes': [(
+                recipe.author.username[start:], recipe.name, recipe.text,
+                recipe.cooking_time,
+                sorted(tag.slug for tag in recipe.tags.all()),
+                sorted((amount.ingredient_id, amount.amount)
+                       for amount in recipe.ingredientwithquantity_set.all()),
+            ) for recipe in recipes],
+            'favourites': sorted(
+                (username[start:], numbers[recipe_id])
+                for username, recipe_id in Favourite.objects.filter(
+                    user__username__startswith=f'{prefix}_'
+                ).values_list('user__username', 'recipe_id')),
+            'subscriptions': sorted(
+                (username[start:], author[start:])
+                for username, author in Subscription.objects.filter(
+                    user__username__startswith=f'{prefix}_'
+                ).values_list('user__username',
+                              'subscriptions__username')),
+            'cart': sorted(
+                (username[start:], numbers[recipe_id])
+                for username, recipe_id in ShoppingCard.objects.filter(
+                    user__username__startswith=f'{prefix}_',
+                    recipes__isnull=False,
+                ).values_list('user__username', 'recipes')),
+        }
+
+    def test_same_seed_gives_same_data(self):
+        for prefix in ('first', 'second'):
+            call_command('generate_fake_data', users=8, recipes=12,
+                         favourites=3, subscriptions=2, cart=2, seed=7,
+                         prefix=prefix, stdout=StringIO())
+        first = self.snapshot('first')
+        self.assertEqual(len(first['recipes']), 12)
+        self.assertTrue(first['favourites'])
+        self.assertEqual(first, self.snapshot('second'))
+
+    def test_invalid_counts_are_rejected(self):
+        for options in ({'users': 0, 'recipes': 5}, {'recipes': -1},
+                        {'batch_size': 0}):
+            with self.subTest(**options), self.assertRaises(CommandError):
+                call_command('generate_fake_data', stdout=StringIO(),
+                             **options)
+        self.assertFalse(User.objects.exists())
@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from recipes import images
+from recipes.models import Recipe
+from users.models import User
+
+SIZES = {
+    'thumbnail': ('JPEG', (200, 100)),
+    'thumbnail_webp': ('WEBP', (200, 100)),
+    'card': ('JPEG', (640, 320)),
+    'card_webp': ('WEBP', (640, 320)),
+    'webp': ('WEBP', (1000, 500)),
+}
+
+
+@override_settings(TIMELINE_WORKERS=0, RECIPE_IMAGE_WORKERS=0)
+class RecipeImageVariantsTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        overrides = self.settings(MEDIA_ROOT=media)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        buffer = BytesIO()
+        Image.new('RGBA', (1000, 500), (255, 0, 0, 128)).save(buffer, 'PNG')
+        self.image_name = default_storage.save(
+            'recipe/source.png', ContentFile(buffer.getvalue()))
+        author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', image=self.image_name, text='Текст',
+            cooking_time=10, author=author)
+
+    def assertVariants(self, variants):
+        self.assertEqual(set(variants), set(SIZES))
+        for variant, (image_format, size) in SIZES.items():
+            with default_storage.open(variants[variant]) as file, \
+                    Image.open(file) as picture:
+                self.assertEqual(picture.format, image_format)
+                self.assertEqual(picture.size, size)
+
+    def stored_variants(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.image_variants
+
+    def test_build_variants(self):
+        variants = images.build_variants(self.image_name)
+        self.assertVariants(variants)
+        self.assertTrue(all(name.startswith('recipe/variants/')
+                            for name in variants.values()))
+
+    def test_variants_are_built_inline_without_workers(self):
+        images.schedule_variants(self.recipe.pk, self.image_name)
+        self.assertVariants(self.stored_variants())
+
+    def test_variants_of_replaced_image_are_dropped(self):
+        variants = {'thumbnail': 'recipe/variants/old_thumbnail.jpeg'}
+        images.save_variants(self.recipe.pk, 'recipe/old.png', variants)
+        self.assertEqual(self.stored_variants(), {})
+        images.save_variants(self.recipe.pk, self.image_name, variants)
+        self.assertEqual(self.stored_variants(), variants)
+
+    @mock.patch('recipes.images.connection')
+    def test_lost_task_is_built_in_thread(self, connection):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        images._variants_built(self.recipe.pk, self.image_name, future)
+        self.assertVariants(self.stored_variants())
+        connection.close.assert_called_once_with()
+
+    @override_settings(RECIPE_IMAGE_WORKERS=1)
+    @mock.patch('recipes.images.connection')
+    def test_broken_pool_is_replaced(self, connection):
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+        replacement = mock.Mock()
+
+        def submit(function, *args):
+            future = Future()
+            future.set_result(function(*args))
+            return future
+
+        replacement.submit.side_effect = submit
+        with mock.patch.object(images, '_executor', broken), \
+                mock.patch('recipes.images.ProcessPoolExecutor',
+                           return_value=replacement):
+            images.schedule_variants(self.recipe.pk, self.image_name)
+            self.assertIs(images._executor, replacement)
+        broken.shutdown.assert_called_once_with(wait=False)
+        self.assertVariants(self.stored_variants())
@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase
+
+from recipes import loader
+from recipes.models import Ingredient
+
+
+class LoaderTests(TestCase):
+
+    def write(self, name, content):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_csv_header_blanks_and_repeats_are_skipped(self):
+        path = self.write('ingredients.csv', (
+            'name,measurement_unit\n'
+            'тест мука,г\n'
+            '\n'
+            ' тест мука , г \n'
+            'тест соль,\n'
+            '"тест перец, молотый",г\n'))
+        self.assertEqual(list(loader.read_ingredients(path)), [
+            ('тест мука', 'г'), ('тест перец, молотый', 'г')])
+
+    def test_csv_without_header(self):
+        path = self.write('ingredients.csv', 'тест мука,г\n')
+        self.assertEqual(list(loader.read_ingredients(path)),
+                         [('тест мука', 'г')])
+
+    def test_json_is_read_across_chunks(self):
+        items = [{'name': f'тест "ингредиент" {number}',
+                  'measurement_unit': 'г'} for number in range(20)]
+        path = self.write('ingredients.json',
+                          json.dumps(items, ensure_ascii=False, indent=1))
+        with mock.patch.object(loader, 'READ_CHUNK_SIZE', 16):
+            rows = list(loader.read_ingredients(path))
+        self.assertEqual(rows, [(item['name'], 'г') for item in items])
+
+    def test_json_must_be_an_array(self):
+        path = self.write('ingredients.json', '{"name": "тест"}')
+        with self.assertRaises(ValueError):
+            list(loader.read_ingredients(path))
+
+    def test_truncated_json_is_rejected(self):
+        path = self.write('ingredients.json',
+                          '[{"name": "тест мука", "measurement_unit"')
+        with self.assertRaises(ValueError):
+            list(loader.read_ingredients(path))
+
+    def test_reload_adds_only_new_rows(self):
+        Ingredient.objects.create(name='тест мука', measurement_unit='г')
+        path = self.write('ingredients.csv',
+                          'тест мука,г\nтест соль,г\nтест соль,кг\n')
+        self.assertEqual(loader.load_ingredients(Ingredient, path,
+                                                 batch_size=2), 2)
+        self.assertEqual(loader.load_ingredients(Ingredient, path), 0)
+        self.assertEqual(Ingredient.objects.filter(
+            name__startswith='тест ').count(), 3)
+
+    def test_csv_stream_reads_rows_lazily(self):
+        rows = [(f'тест, {number}', 'г') for number in range(50)]
+        consumed = []
+
+        def generate():
+            for row in rows:
+                consumed.append(row)
+                yield row
+
+        stream = loader.CSVStream(generate())
+        first = stream.read(32)
+        self.assertEqual(len(first), 32)
+        self.assertLess(len(consumed), 5)
+        chunks = [first]
+        while True:
+            chunk = stream.read(32)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        self.assertEqual(
+            [tuple(row) for row in csv.reader(StringIO(''.join(chunks)))],
+            rows)
@@ -0,0 +1,55 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.metrics import QUERIES, SERIALIZER_SECONDS
+from recipes.models import Recipe
+from users.models import User
+
+
+def observed(histogram):
+    count = sum(bucket.get() for bucket in histogram._buckets)
+    return count, histogram._sum.get()
+
+
+@override_settings(TIMELINE_WORKERS=0)
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+
+    def test_serializer_time_is_recorded(self):
+        Recipe.objects.create(name='Суп', image='', text='Текст',
+                              cooking_time=10, author=self.author)
+        histogram = SERIALIZER_SECONDS.labels('RecipeViewSet', 'list', 'GET')
+        before = observed(histogram)
+        self.assertEqual(self.client.get('/api/recipes/').status_code, 200)
+        count, total = observed(histogram)
+        self.assertEqual(count, before[0] + 1)
+        self.assertGreater(total, before[1])
+
+    def test_queries_of_streamed_body_are_counted(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        histogram = QUERIES.labels('RecipeViewSet', 'download_shopping_cart',
+                                   'GET')
+        before = observed(histogram)
+        response = client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(observed(histogram), before)
+        b''.join(response.streaming_content)
+        count, total = observed(histogram)
+        self.assertEqual(count, before[0] + 1)
+        self.assertGreaterEqual(total, before[1] + 1)
+
+    def test_metrics_are_private(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        outside = {'REMOTE_ADDR': '203.0.113.7'}
+        self.assertEqual(self.client.get('/metrics', **outside).status_code,
+                         404)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer wrong',
+                **outside).status_code, 404)
+            self.assertEqual(self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer secret',
+                **outside).status_code, 200)
@@ -0,0 +1,78 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+
+@override_settings(TIMELINE_WORKERS=0)
+class FeedPaginationTests(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.recipes = [Recipe.objects.create(
+            name=f'Суп {number}' if number % 2 else f'Каша {number}',
+            image='', text='Текст', cooking_time=10, author=author)
+            for number in range(9)]
+        self.client = APIClient()
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_walks_all_recipes_by_id(self):
+        page = self.get('/api/recipes/', {'cursor': ''})
+        self.assertNotIn('count', page)
+        seen = []
+        while True:
+            seen.extend(recipe['id'] for recipe in page['results'])
+            if not page['next']:
+                break
+            page = self.get(page['next'])
+        self.assertEqual(seen, [recipe.pk for recipe in
+                                reversed(self.recipes)])
+
+    def test_cursor_is_ignored_with_search(self):
+        page = self.get('/api/recipes/', {'cursor': '', 'search': 'суп'})
+        self.assertEqual(page['count'], 4)
+        self.assertEqual(len(page['results']), 4)
+
+    def test_short_page_is_last_with_approximate_count(self):
+        with mock.patch('recipes.pagination.estimate_count',
+                        return_value=100000):
+            page = self.get('/api/recipes/')
+            self.assertEqual(page['count'], 100000)
+            page = self.get(page['next'])
+        self.assertEqual(len(page['results']), 3)
+        self.assertIsNone(page['next'])
+
+    def test_estimate_does_not_hide_pages(self):
+        with mock.patch('recipes.pagination.estimate_count',
+                        return_value=3):
+            page = self.get('/api/recipes/')
+            self.assertIsNotNone(page['next'])
+            page = self.get(page['next'])
+        self.assertEqual(len(page['results']), 3)
+        self.assertEqual(page['count'], 9)
+        self.assertIsNone(page['next'])
+
+    def test_page_past_the_end_is_not_found(self):
+        with mock.patch('recipes.pagination.estimate_count',
+                        return_value=100000):
+            response = self.client.get('/api/recipes/', {'page': 5})
+        self.assertEqual(response.status_code, 404)
+
+    def test_last_page_is_counted_without_count_query(self):
+        with mock.patch('recipes.pagination.estimate_count') as estimate:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.get('/api/recipes/', {'page': 2})
+        estimate.assert_not_called()
+        self.assertEqual(page['count'], 9)
+        self.assertFalse(any('COUNT(' in query['sql'].upper()
+                             for query in queries.captured_queries))
@@ -0,0 +1,72 @@
+from django.test import TestCase, override_settings
+
+from recipes import catalogue, pantry
+from recipes.models import Ingredient, IngredientWithQuantity, Recipe
+from users.models import User
+
+
+@override_settings(PANTRY_INDEX_REFRESH=0, TIMELINE_WORKERS=0)
+class PantryIndexTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.flour, self.milk = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('тест мука', 'тест молоко')]
+        self.pancakes = self.recipe({self.flour: 200, self.milk: 500})
+        pantry._index = None
+        self.addCleanup(setattr, pantry, '_index', None)
+
+    def recipe(self, amounts):
+        recipe = Recipe.objects.create(
+            name='Рецепт', image='recipe/test.jpg', text='Текст',
+            cooking_time=10, author=self.author)
+        IngredientWithQuantity.objects.bulk_create(
+            IngredientWithQuantity(recipe=recipe, ingredient=ingredient,
+                                   amount=amount)
+            for ingredient, amount in amounts.items())
+        return recipe
+
+    def matches(self, *ingredients):
+        recipe_ids, missing = pantry.get_pantry_index().match(
+            [ingredient.pk for ingredient in ingredients])
+        return dict(zip(recipe_ids.tolist(), missing.tolist()))
+
+    def test_local_change_keeps_index_current(self):
+        index = pantry.get_pantry_index()
+        pancakes = self.pancakes.pk
+        self.assertEqual(self.matches(self.flour), {pancakes: 1})
+        omelette = self.recipe({self.milk: 100})
+        pantry.refresh_recipe(omelette.pk)
+        self.assertIs(pantry.get_pantry_index(), index)
+        self.assertEqual(self.matches(self.milk),
+                         {omelette.pk: 0, pancakes: 1})
+        pantry.forget_recipe(pancakes)
+        self.assertIs(pantry.get_pantry_index(), index)
+        self.assertEqual(self.matches(self.milk), {omelette.pk: 0})
+
+    def test_changed_recipes_are_compacted(self):
+        index = pantry.PantryIndex([(1, 10), (1, 11), (2, 10)] + [
+            (recipe_id, 12) for recipe_id in range(3, 9)])
+        index.set_recipe(1, [11])
+        recipe_ids, missing = index.match([10])
+        self.assertEqual(recipe_ids.tolist(), [2])
+        self.assertEqual(index.dead, 1)
+        for recipe_id in range(3, 9):
+            index.remove_recipe(recipe_id)
+        self.assertEqual(index.size, 2)
+        self.assertNotIn(12, index.postings)
+        recipe_ids, missing = index.match([10, 11])
+        self.assertEqual(dict(zip(recipe_ids.tolist(), missing.tolist())),
+                         {1: 0, 2: 0})
+
+    def test_foreign_change_is_not_adopted(self):
+        index = pantry.get_pantry_index()
+        omelette = self.recipe({self.milk: 100})
+        catalogue.invalidate(pantry.CATALOGUE)
+        porridge = self.recipe({self.milk: 300})
+        pantry.refresh_recipe(porridge.pk)
+        self.assertIsNot(pantry.get_pantry_index(), index)
+        self.assertEqual(set(self.matches(self.milk)),
+                         {self.pancakes.pk, omelette.pk, porridge.pk})
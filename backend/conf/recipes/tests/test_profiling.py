@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from recipes import profiling
+from users.models import User
+
+
+class SlowQueryLoggerTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(PROFILE_DIR=self.directory,
+                                      SLOW_QUERY_SECONDS=1e-9,
+                                      SLOW_QUERY_COOLDOWN=60)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        profiling._captured.data.clear()
+
+    def run_lookup(self, email):
+        with connection.execute_wrapper(
+                profiling.SlowQueryLogger('/api/users/')):
+            list(User.objects.filter(email=email))
+
+    def captures(self):
+        return [name for name in os.listdir(self.directory)
+                if name.endswith('.txt')]
+
+    def test_params_are_not_stored(self):
+        with self.assertLogs('recipes.profiling', 'WARNING') as logs:
+            self.run_lookup('secret@example.com')
+        [name] = self.captures()
+        with open(os.path.join(self.directory, name),
+                  encoding='utf-8') as file:
+            content = file.read()
+        self.assertNotIn('secret', content)
+        self.assertNotIn('secret', '\n'.join(logs.output))
+        self.assertIn('SELECT', content)
+
+    def test_same_query_is_captured_once_per_cooldown(self):
+        with self.assertLogs('recipes.profiling', 'WARNING'):
+            self.run_lookup('first@example.com')
+            self.run_lookup('second@example.com')
+        self.assertEqual(len(self.captures()), 1)
+
+    def test_redact_plan_hides_string_literals(self):
+        plan = "Index Cond: ((key)::text = 'abc''d'::text)"
+        self.assertEqual(profiling.redact_plan(plan),
+                         "Index Cond: ((key)::text = '?'::text)")
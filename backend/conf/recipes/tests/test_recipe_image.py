@@ -0,0 +1,131 @@
+import base64
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from recipes import catalogue
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.serializers import RecipeImageField
+from users.models import User
+
+
+def image_bytes(image_format='PNG', size=(4, 4)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def data_uri(content, image_format='png'):
+    encoded = base64.b64encode(content).decode()
+    return f'data:image/{image_format};base64,{encoded}'
+
+
+class RecipeImageFieldTests(TestCase):
+
+    def setUp(self):
+        self.field = RecipeImageField()
+
+    def assertFails(self, data, code):
+        with self.assertRaises(ValidationError) as error:
+            self.field.to_internal_value(data)
+        self.assertEqual(error.exception.detail[0].code, code)
+
+    def test_multipart_upload(self):
+        upload = SimpleUploadedFile('photo.bin', image_bytes('JPEG'))
+        image = self.field.to_internal_value(upload)
+        self.assertIs(image, upload)
+        self.assertEqual(image.name, 'image.jpeg')
+        self.assertEqual(image.tell(), 0)
+
+    def test_base64_is_decoded_in_chunks(self):
+        content = image_bytes(size=(64, 64))
+        with mock.patch.object(RecipeImageField, 'chunk_size', 8):
+            image = self.field.to_internal_value(data_uri(content))
+        self.assertEqual(image.name, 'image.png')
+        self.assertEqual(image.read(), content)
+        image.close()
+
+    def test_invalid_base64_is_rejected(self):
+        self.assertFails('data:image/png;base64,@@@@', 'invalid')
+        self.assertFails('not an image', 'invalid')
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=100)
+    def test_size_limit(self):
+        content = image_bytes(size=(200, 200)) + b'\0' * 200
+        self.assertFails(data_uri(content), 'too_large')
+        self.assertFails(SimpleUploadedFile('photo.png', content),
+                         'too_large')
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=99)
+    def test_pixel_limit(self):
+        self.assertFails(data_uri(image_bytes(size=(10, 10))), 'invalid')
+
+    def test_format_is_rejected(self):
+        self.assertFails(data_uri(image_bytes('BMP'), 'bmp'), 'format')
+
+    def test_decoded_file_is_closed_on_rejection(self):
+        files = []
+        temporary_file = tempfile.TemporaryFile
+
+        def track():
+            file = temporary_file()
+            files.append(file)
+            return file
+
+        with mock.patch('recipes.serializers.tempfile.TemporaryFile',
+                        track):
+            self.assertFails(data_uri(image_bytes('BMP'), 'bmp'), 'format')
+            self.assertFails(data_uri(b'not an image'), 'invalid')
+        self.assertEqual(len(files), 2)
+        self.assertTrue(all(file.closed for file in files))
+
+
+@override_settings(TIMELINE_WORKERS=0, RECIPE_IMAGE_WORKERS=0)
+class RecipeImageApiTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        overrides = self.settings(MEDIA_ROOT=media)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                      slug='lunch')
+        self.flour = Ingredient.objects.create(name='тест мука',
+                                               measurement_unit='г')
+        catalogue.invalidate('tags')
+        catalogue.invalidate('ingredients')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def create(self, image):
+        return self.client.post('/api/recipes/', {
+            'name': 'Блины', 'text': 'Текст', 'cooking_time': 15,
+            'tags': [self.tag.pk], 'image': image,
+            'ingredients': [{'id': self.flour.pk, 'amount': 200}],
+        }, format='json')
+
+    def test_base64_image_is_stored(self):
+        content = image_bytes()
+        response = self.create(data_uri(content))
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get()
+        self.assertTrue(recipe.image.name.startswith('recipe/'))
+        self.assertTrue(recipe.image.name.endswith('.png'))
+        with recipe.image.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+
+    def test_rejected_image_creates_nothing(self):
+        response = self.create(data_uri(image_bytes('BMP'), 'bmp'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
@@ -0,0 +1,88 @@
+import csv
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes import catalogue
+from recipes.models import (Ingredient, IngredientWithQuantity, Recipe,
+                            ShoppingCard)
+from recipes.renderers import PDFShoppingListRenderer
+from users.models import User
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+@override_settings(TIMELINE_WORKERS=0)
+class DownloadShoppingCartTests(TestCase):
+
+    def setUp(self):
+        self.buyer = User.objects.create_user(
+            'buyer', 'buyer@example.com', 'password')
+        ShoppingCard.objects.create(user=self.buyer)
+        flour, milk, eggs = [
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('тест мука', 'г'), ('тест молоко', 'мл'),
+                               ('тест яйца', 'шт'))]
+        catalogue.invalidate('ingredients')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        for amounts in ({flour: 200, milk: 500}, {milk: 100, eggs: 3}):
+            recipe = Recipe.objects.create(
+                name='Рецепт', image='recipe/test.jpg', text='Текст',
+                cooking_time=10, author=self.buyer)
+            IngredientWithQuantity.objects.bulk_create(
+                IngredientWithQuantity(recipe=recipe, ingredient=ingredient,
+                                       amount=amount)
+                for ingredient, amount in amounts.items())
+            self.assertEqual(self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/').status_code,
+                201)
+
+    def download(self, **params):
+        response = self.client.get(URL, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_text(self):
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; '
+                         'filename=user-shopping-ingredients.txt')
+        self.assertEqual(content.decode().splitlines(), [
+            'тест молоко (мл) - 600',
+            'тест мука (г) - 200',
+            'тест яйца (шт) - 3',
+        ])
+
+    def test_csv(self):
+        response, content = self.download(format='csv')
+        self.assertEqual(response['Content-Type'],
+                         'text/csv; charset=utf-8')
+        self.assertEqual(list(csv.reader(StringIO(content.decode()))), [
+            ['name', 'measurement_unit', 'amount'],
+            ['тест молоко', 'мл', '600'],
+            ['тест мука', 'г', '200'],
+            ['тест яйца', 'шт', '3'],
+        ])
+
+    def test_pdf_is_streamed_in_chunks(self):
+        with mock.patch.object(PDFShoppingListRenderer, 'chunk_size', 256):
+            response = self.client.get(URL, HTTP_ACCEPT='application/pdf')
+            chunks = list(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertGreater(len(chunks), 1)
+        content = b''.join(chunks)
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(b'%%EOF', content[-32:])
+
+    def test_anonymous_user_gets_plain_error(self):
+        response = APIClient().get(URL)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+        self.assertTrue(response.content.startswith(b'detail: '))
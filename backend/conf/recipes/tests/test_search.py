@@ -0,0 +1,38 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+
+@override_settings(TIMELINE_WORKERS=0)
+class RecipeSearchTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.client = APIClient()
+
+    def create(self, name, text):
+        return Recipe.objects.create(name=name, image='', text=text,
+                                     cooking_time=10, author=self.author)
+
+    def search(self, value):
+        response = self.client.get('/api/recipes/', {'search': value})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_match_ranks_above_text_match(self):
+        in_text = self.create('Обед', 'Грибной суп с перловкой')
+        in_name = self.create('Грибной суп', 'Варить час')
+        self.create('Каша', 'Овсянка на молоке')
+        self.assertEqual(self.search('грибной суп'), [in_name.pk, in_text.pk])
+
+    def test_index_follows_edit_and_delete(self):
+        recipe = self.create('Суп', 'Варить час')
+        recipe.name = 'Борщ'
+        recipe.save()
+        self.assertEqual(self.search('суп'), [])
+        self.assertEqual(self.search('борщ'), [recipe.pk])
+        recipe.delete()
+        self.assertEqual(self.search('борщ'), [])
@@ -0,0 +1,141 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes import catalogue, shopping
+from recipes.models import (Ingredient, IngredientWithQuantity, Recipe,
+                            ShoppingCard, ShoppingListItem, Tag)
+from users.models import User
+
+
+@override_settings(TIMELINE_WORKERS=0)
+class ShoppingListTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.buyer = User.objects.create_user(
+            'buyer', 'buyer@example.com', 'password')
+        ShoppingCard.objects.create(user=self.author)
+        ShoppingCard.objects.create(user=self.buyer)
+        self.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                      slug='lunch')
+        self.flour, self.milk, self.eggs = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('тест мука', 'тест молоко', 'тест яйца')]
+        catalogue.invalidate('tags')
+        catalogue.invalidate('ingredients')
+        self.pancakes = self.recipe('Блины', {self.flour: 200,
+                                              self.milk: 500})
+        self.omelette = self.recipe('Омлет', {self.milk: 100,
+                                              self.eggs: 3})
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def recipe(self, name, amounts):
+        recipe = Recipe.objects.create(
+            name=name, image='recipe/test.jpg', text='Текст',
+            cooking_time=10, author=self.author)
+        IngredientWithQuantity.objects.bulk_create(
+            IngredientWithQuantity(recipe=recipe, ingredient=ingredient,
+                                   amount=amount)
+            for ingredient, amount in amounts.items())
+        return recipe
+
+    def cart(self, recipe, method='post'):
+        return getattr(self.client, method)(
+            f'/api/recipes/{recipe.pk}/shopping_cart/')
+
+    def totals(self, user=None):
+        return dict(ShoppingListItem.objects.filter(
+            user=user or self.buyer).values_list(
+                'ingredient_id', 'total_amount'))
+
+    def test_cart_changes_update_totals(self):
+        self.assertEqual(self.cart(self.pancakes).status_code, 201)
+        self.assertEqual(self.cart(self.omelette).status_code, 201)
+        self.assertEqual(self.totals(), {
+            self.flour.pk: 200, self.milk.pk: 600, self.eggs.pk: 3})
+        self.assertEqual(self.cart(self.pancakes).status_code, 400)
+        self.assertEqual(self.cart(self.pancakes, 'delete').status_code,
+                         204)
+        self.assertEqual(self.totals(), {self.milk.pk: 100,
+                                         self.eggs.pk: 3})
+        self.assertEqual(self.cart(self.pancakes, 'delete').status_code,
+                         400)
+
+    def test_recipe_update_changes_totals(self):
+        self.cart(self.pancakes)
+        self.cart(self.omelette)
+        author = APIClient()
+        author.force_authenticate(self.author)
+        response = author.patch(
+            f'/api/recipes/{self.pancakes.pk}/', {
+                'name': 'Блины', 'text': 'Текст', 'cooking_time': 15,
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': self.milk.pk, 'amount': 300},
+                                {'id': self.eggs.pk, 'amount': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.totals(), {self.milk.pk: 400,
+                                         self.eggs.pk: 5})
+        self.assertEqual(self.totals(self.author), {})
+
+    def test_recipe_update_locks_only_its_ingredient_rows(self):
+        author = APIClient()
+        author.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = author.put(
+                f'/api/recipes/{self.pancakes.pk}/', {
+                    'name': 'Блины', 'text': 'Текст', 'cooking_time': 15,
+                    'tags': [self.tag.pk],
+                    'ingredients': [{'id': self.milk.pk, 'amount': 300}],
+                }, format='json')
+        self.assertEqual(response.status_code, 200)
+        table = IngredientWithQuantity._meta.db_table
+        locked = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith('SELECT')
+                  and f'FROM "{table}" WHERE "{table}"."recipe_id" = '
+                  in query['sql']]
+        self.assertEqual(len(locked), 1)
+        self.assertNotIn('JOIN', locked[0])
+
+    def test_recipe_delete_changes_totals(self):
+        self.cart(self.pancakes)
+        self.cart(self.omelette)
+        author = APIClient()
+        author.force_authenticate(self.author)
+        response = author.delete(f'/api/recipes/{self.pancakes.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.totals(), {self.milk.pk: 100,
+                                         self.eggs.pk: 3})
+
+    def test_rebuild_repairs_drift(self):
+        self.cart(self.pancakes)
+        ShoppingListItem.objects.filter(ingredient=self.flour).update(
+            total_amount=1)
+        ShoppingListItem.objects.filter(ingredient=self.milk).delete()
+        ShoppingListItem.objects.create(user=self.buyer,
+                                        ingredient=self.eggs,
+                                        total_amount=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', '--check',
+                         stdout=StringIO())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+        self.assertEqual(self.totals(), {self.flour.pk: 200,
+                                         self.milk.pk: 500})
+
+    def test_repair_keeps_cart_change_made_after_scan(self):
+        self.cart(self.pancakes)
+        ShoppingListItem.objects.filter(ingredient=self.flour).update(
+            total_amount=1)
+        users = shopping.drifted_users()
+        self.cart(self.omelette)
+        self.assertEqual(shopping.repair(users), 1)
+        self.assertEqual(self.totals(), {
+            self.flour.pk: 200, self.milk.pk: 600, self.eggs.pk: 3})
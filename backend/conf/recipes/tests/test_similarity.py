@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes import catalogue, similarity
+from recipes.models import (Favourite, Recipe, RecipeSimilarity,
+                            StaleSimilarity)
+from users.models import User
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0, TIMELINE_WORKERS=0)
+class SimilarRecipesTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.recipes = [Recipe.objects.create(
+            name=f'Рецепт {number}', image='', text='Текст',
+            cooking_time=10, author=self.author) for number in range(3)]
+        first, second, third = self.recipes
+        for number, liked in enumerate(([first, second], [first, second],
+                                        [second, third])):
+            user = User.objects.create_user(
+                f'user{number}', f'user{number}@example.com', 'password')
+            for recipe in liked:
+                Favourite.objects.create(user=user, recipe=recipe)
+
+    def similar(self, recipe):
+        response = APIClient().get(f'/api/recipes/{recipe.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_neighbours_are_ordered_by_score(self):
+        self.assertEqual(similarity.build_similarities(full=True), 3)
+        first, second, third = self.recipes
+        self.assertEqual(self.similar(second), [first.pk, third.pk])
+        self.assertEqual(self.similar(first), [second.pk])
+
+    def test_marks_made_during_rebuild_are_kept(self):
+        first, second, third = self.recipes
+        StaleSimilarity.objects.create(recipe=first)
+        StaleSimilarity.objects.create(
+            recipe=second, marked=timezone.now() + timedelta(minutes=1))
+        similarity.build_similarities()
+        self.assertEqual(list(StaleSimilarity.objects.values_list(
+            'recipe_id', flat=True)), [second.pk])
+        self.assertTrue(RecipeSimilarity.objects.filter(
+            recipe=first).exists())
+
+    def test_recipe_edit_invalidates_cached_lists(self):
+        similarity.build_similarities(full=True)
+        first, second, third = self.recipes
+        version = catalogue.get_version(similarity.CATALOGUE)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.name = 'Новое название'
+            first.save()
+        self.assertNotEqual(
+            catalogue.get_version(similarity.CATALOGUE), version)
+        response = APIClient().get(f'/api/recipes/{second.pk}/similar/')
+        self.assertEqual(response.data[0]['name'], 'Новое название')
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+
+from recipes.models import Recipe
+from recipes.storage import ContentAddressedStorage
+from users.models import User
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.root)
+
+    def age(self, name, seconds):
+        path = self.storage.path(name)
+        past = time.time() - seconds
+        os.utime(path, (past, past))
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('recipe/a.jpg', ContentFile(b'image'))
+        second = self.storage.save('recipe/b.JPG', ContentFile(b'image'))
+        other = self.storage.save('recipe/c.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(first.startswith('recipe/'))
+        self.assertTrue(first.endswith('.jpg'))
+        self.assertEqual(len(os.listdir(os.path.dirname(
+            self.storage.path(first)))), 1)
+
+    def test_duplicate_upload_refreshes_modified_time(self):
+        name = self.storage.save('recipe/a.jpg', ContentFile(b'image'))
+        self.age(name, 3600)
+        self.storage.save('recipe/b.jpg', ContentFile(b'image'))
+        self.assertLess(time.time() - os.path.getmtime(
+            self.storage.path(name)), 60)
+
+
+class CollectOrphanMediaTests(TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=root)
+        overrides = self.settings(MEDIA_ROOT=root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def save(self, content, age):
+        name = self.storage.save('recipe/image.jpg', ContentFile(content))
+        past = time.time() - age
+        os.utime(self.storage.path(name), (past, past))
+        return name
+
+    def collect(self, *args):
+        call_command('collect_orphan_media', *args, stdout=StringIO())
+
+    def test_only_old_unreferenced_files_are_deleted(self):
+        author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        image = self.save(b'image', 7200)
+        variant = self.save(b'variant', 7200)
+        orphan = self.save(b'orphan', 7200)
+        fresh = self.save(b'fresh', 0)
+        Recipe.objects.create(
+            name='Рецепт', image=image, image_variants={'card': variant},
+            text='Текст', cooking_time=10, author=author)
+        self.collect()
+        self.assertTrue(self.storage.exists(orphan))
+        self.collect('--delete')
+        self.assertFalse(self.storage.exists(orphan))
+        for name in (image, variant, fresh):
+            self.assertTrue(self.storage.exists(name))
+
+    def test_reuploaded_orphan_is_kept(self):
+        orphan = self.save(b'orphan', 7200)
+        self.storage.save('recipe/again.jpg', ContentFile(b'orphan'))
+        self.collect('--delete')
+        self.assertTrue(self.storage.exists(orphan))
@@ -0,0 +1,37 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, Subscription
+from users.models import User
+
+
+@override_settings(TIMELINE_WORKERS=0)
+class SubscriptionsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'reader', 'reader@example.com', 'password')
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_no_subscriptions(self):
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(response.data['results'], [])
+
+    def test_recipes_limit(self):
+        Subscription.objects.create(user=self.user,
+                                    subscriptions=self.author)
+        recipes = [Recipe.objects.create(
+            name=f'Рецепт {number}', image='recipe/test.jpg', text='Текст',
+            cooking_time=10, author=self.author) for number in range(3)]
+        response = self.client.get('/api/users/subscriptions/',
+                                   {'recipes_limit': 2})
+        self.assertEqual(response.status_code, 200)
+        [author] = response.data['results']
+        self.assertEqual(author['id'], self.author.pk)
+        self.assertEqual([recipe['id'] for recipe in author['recipes']],
+                         [recipes[2].pk, recipes[1].pk])
@@ -0,0 +1,106 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes import timeline
+from recipes.models import Recipe, Subscription, Timeline
+from recipes.pagination import TimelinePagination
+from users.models import User
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0, TIMELINE_WORKERS=0,
+                   TIMELINE_BACKFILL=2, TIMELINE_FANOUT_MAX_SUBSCRIBERS=2)
+class TimelineTests(TestCase):
+
+    def setUp(self):
+        self.reader = User.objects.create_user(
+            'reader', 'reader@example.com', 'password')
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def recipe(self, author=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                name='Рецепт', image='', text='Текст',
+                cooking_time=10, author=author or self.author)
+
+    def subscribe(self, user, author=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Subscription.objects.create(
+                user=user, subscriptions=author or self.author)
+
+    def feed(self, **params):
+        response = self.client.get('/api/recipes/feed/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, **params):
+        return [recipe['id'] for recipe in self.feed(**params)['results']]
+
+    def test_subscribe_backfills_recent_recipes(self):
+        recipes = [self.recipe() for _ in range(3)]
+        self.subscribe(self.reader)
+        self.assertEqual(self.ids(), [recipes[2].pk, recipes[1].pk])
+
+    def test_new_recipe_fans_out_to_subscribers(self):
+        self.subscribe(self.reader)
+        recipe = self.recipe()
+        self.assertTrue(Timeline.objects.filter(
+            user=self.reader, recipe=recipe).exists())
+        self.assertEqual(self.ids(), [recipe.pk])
+
+    def test_unsubscribe_removes_author(self):
+        subscription = self.subscribe(self.reader)
+        self.recipe()
+        with self.captureOnCommitCallbacks(execute=True):
+            subscription.delete()
+        self.assertEqual(self.ids(), [])
+        self.assertFalse(Timeline.objects.filter(user=self.reader).exists())
+
+    def test_late_fan_out_after_unsubscribe_is_hidden(self):
+        recipe = self.recipe()
+        timeline.fan_out([recipe.pk], self.author.pk)
+        Timeline.objects.create(user=self.reader, recipe=recipe,
+                                author=self.author)
+        self.assertEqual(self.ids(), [])
+
+    def test_popular_author_is_read_from_recipes(self):
+        fan = User.objects.create_user('fan', 'fan@example.com', 'password')
+        self.subscribe(fan)
+        self.subscribe(self.reader)
+        recipe = self.recipe()
+        self.assertFalse(Timeline.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.ids(), [recipe.pk])
+
+    @override_settings(TIMELINE_FANOUT_MAX_SUBSCRIBERS=3)
+    def test_author_below_threshold_fans_out_again(self):
+        subscriptions = [self.subscribe(User.objects.create_user(
+            f'fan{number}', f'fan{number}@example.com', 'password'))
+            for number in range(3)]
+        self.subscribe(self.reader)
+        recipe = self.recipe()
+        self.assertFalse(Timeline.objects.filter(recipe=recipe).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            for subscription in subscriptions:
+                subscription.delete()
+        self.assertTrue(Timeline.objects.filter(
+            user=self.reader, recipe=recipe).exists())
+        self.assertEqual(self.ids(), [recipe.pk])
+
+    def test_cursor_pages(self):
+        self.subscribe(self.reader)
+        recipes = [self.recipe() for _ in range(5)]
+        seen = []
+        with mock.patch.object(TimelinePagination, 'page_size', 2):
+            page = self.feed()
+            while True:
+                seen.extend(recipe['id'] for recipe in page['results'])
+                if not page['next']:
+                    break
+                page = self.client.get(page['next']).data
+        self.assertEqual(seen, [recipe.pk for recipe in reversed(recipes)])
+        self.assertEqual(self.client.get(
+            '/api/recipes/feed/', {'cursor': 'x'}).status_code, 404)
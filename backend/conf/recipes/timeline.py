@@ -0,0 +1,174 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from recipes.models import Recipe, Subscription, Timeline
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.TIMELINE_WORKERS)
+    return _executor
+
+
+def _run(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Timeline task %s%r failed', function.__name__,
+                         args)
+    finally:
+        connection.close()
+
+
+def schedule(function, *args):
+    """Выполняет раздачу в фоновом потоке.
+
+    При `TIMELINE_WORKERS = 0` она выполняется сразу.
+    """
+    if not settings.TIMELINE_WORKERS:
+        function(*args)
+        return
+    get_executor().submit(_run, function, *args)
+
+
+def is_popular(subscribers_count):
+    """Рецепты популярных авторов не раздаются подписчикам,
+    а читаются из `Recipe` при построении ленты."""
+    return subscribers_count >= settings.TIMELINE_FANOUT_MAX_SUBSCRIBERS
+
+
+def _insert(entries):
+    with transaction.atomic():
+        Timeline.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def fan_out(recipe_ids, author_id):
+    """Добавляет рецепты в ленты подписчиков автора пачками
+    по `TIMELINE_BATCH_SIZE` записей, каждую в своей транзакции."""
+    subscribers = Subscription.objects.filter(
+        subscriptions_id=author_id).values_list('user_id', flat=True)
+    batch = []
+    for user_id in subscribers.iterator(
+            chunk_size=settings.TIMELINE_BATCH_SIZE):
+        batch.extend(Timeline(user_id=user_id, recipe_id=recipe_id,
+                              author_id=author_id)
+                     for recipe_id in recipe_ids)
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            _insert(batch)
+            batch = []
+    if batch:
+        _insert(batch)
+
+
+def recent_recipes(author_id):
+    return list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-id').values_list('id', flat=True)[:settings.TIMELINE_BACKFILL])
+
+
+def recipe_created(recipe_id, author_id):
+    author = User.objects.filter(pk=author_id).values_list(
+        'subscribers_count', flat=True).first()
+    if author is not None and not is_popular(author):
+        fan_out([recipe_id], author_id)
+
+
+def subscribed(user_id, author_id):
+    """Переносит в ленту нового подписчика последние рецепты автора."""
+    author = User.objects.filter(pk=author_id).values_list(
+        'subscribers_count', flat=True).first()
+    if author is None or is_popular(author):
+        return
+    _insert([Timeline(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id)
+             for recipe_id in recent_recipes(author_id)])
+
+
+def unsubscribed(user_id, author_id):
+    Timeline.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def subscriber_removed(author_id):
+    """Вызывается в транзакции отписки сразу после уменьшения счётчика.
+
+    UPDATE держит строку автора до конца транзакции, поэтому
+    параллельные отписки видят каждая своё значение, и порог
+    пересекает ровно одна из них.
+    """
+    count = User.objects.filter(pk=author_id).values_list(
+        'subscribers_count', flat=True).first()
+    if count == settings.TIMELINE_FANOUT_MAX_SUBSCRIBERS - 1:
+        transaction.on_commit(partial(schedule, author_unpopular,
+                                      author_id))
+
+
+def author_unpopular(author_id):
+    """Автор перестал быть популярным: его рецепты, созданные без
+    раздачи, больше не читаются из `Recipe` и раздаются подписчикам."""
+    fan_out(recent_recipes(author_id), author_id)
+
+
+def feed_ids(user, before=None, limit=None):
+    """Id рецептов ленты пользователя по убыванию, меньше `before`.
+
+    Раздача читается одним проходом по индексу (user, recipe), рецепты
+    популярных авторов — по индексу (author, -id), и результаты
+    сливаются. Раздача, которая успела записать рецепты после
+    отписки, не попадает в ленту: записи отбираются только для
+    авторов из текущих подписок.
+    """
+    timeline = Timeline.objects.filter(user=user).filter(Exists(
+        Subscription.objects.filter(user=user,
+                                    subscriptions_id=OuterRef('author_id'))))
+    if before is not None:
+        timeline = timeline.filter(recipe_id__lt=before)
+    ids = set(timeline.order_by('-recipe_id').values_list(
+        'recipe_id', flat=True)[:limit])
+    popular = list(Subscription.objects.filter(
+        user=user,
+        subscriptions__subscribers_count__gte=(
+            settings.TIMELINE_FANOUT_MAX_SUBSCRIBERS)
+    ).values_list('subscriptions_id', flat=True))
+    for author_id in popular:
+        recipes = Recipe.objects.filter(author_id=author_id)
+        if before is not None:
+            recipes = recipes.filter(id__lt=before)
+        ids.update(recipes.order_by('-id').values_list(
+            'id', flat=True)[:limit])
+    return sorted(ids, reverse=True)[:limit]
+
+
+def rebuild_timelines():
+    """Заново заполняет ленты последними `TIMELINE_BACKFILL` рецептами
+    каждого непопулярного автора, как при подписке."""
+    timeline = Timeline._meta.db_table
+    subscription = Subscription._meta.db_table
+    recipe = Recipe._meta.db_table
+    user = User._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {timeline}')
+        cursor.execute(
+            f'INSERT INTO {timeline} (user_id, recipe_id, author_id) '
+            f'SELECT s.user_id, r.id, r.author_id FROM {subscription} s '
+            'JOIN (SELECT id, author_id, ROW_NUMBER() OVER ('
+            'PARTITION BY author_id ORDER BY id DESC) AS position '
+            f'FROM {recipe}) r ON r.author_id = s.subscriptions_id '
+            f'JOIN {user} u ON u.id = s.subscriptions_id '
+            'WHERE u.subscribers_count < %s AND r.position <= %s',
+            [settings.TIMELINE_FANOUT_MAX_SUBSCRIBERS,
+             settings.TIMELINE_BACKFILL])
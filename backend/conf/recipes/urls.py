@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework import routers
 
-from recipes.views import TagViewSet, IngredientViewSet, RecipeViewSet
+from recipes.views import (TagViewSet, IngredientViewSet, RecipeViewSet,
+                           ProfileCaptureViewSet)
 
 tags = routers.SimpleRouter()
 tags.register(r'tags', TagViewSet)
@@ -9,11 +10,15 @@ ingredients = routers.SimpleRouter()
 ingredients.register(r'ingredients', IngredientViewSet)
 recipes = routers.SimpleRouter()
 recipes.register(r'recipes', RecipeViewSet)
+profiles = routers.SimpleRouter()
+profiles.register(r'profiles', ProfileCaptureViewSet,
+                  basename='profiles')
 
 urlpatterns = [
     path('', include(tags.urls)),
     path('', include(ingredients.urls)),
     path('', include(recipes.urls)),
+    path('', include(profiles.urls)),
     path('', RecipeViewSet.as_view({'get': 'download_shopping_cart'}),
          name='user-download-shopping-cart'),
     path('', RecipeViewSet.as_view({'post': 'shopping_cart'}),
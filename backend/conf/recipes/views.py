@@ -1,21 +1,33 @@
-import io
+from functools import partial
 
-from django.db.models import Value, Count, F, Sum
-from django.db.models.functions import Concat
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (Value, F, Prefetch, Exists,
+                              OuterRef)
+from django.http import FileResponse, Http404, StreamingHttpResponse
 
 from django_filters import rest_framework
 from rest_framework import viewsets, status, permissions
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+from recipes import catalogue, shopping, similarity, timeline
 from recipes.filters import IngredientFilter, RecipeFilter
+from recipes.metrics import MeasuredSerializerMixin, measured
 from recipes.models import (Tag, Ingredient, Subscription, Recipe, Favourite,
-                            ShoppingCard)
+                            ShoppingCard, IngredientWithQuantity,
+                            ShoppingListItem)
+from recipes.pagination import FeedPagination, TimelinePagination
+from recipes.pantry import get_pantry_index
 from recipes.permissions import (RecipePermission)
+from recipes.profiling import get_capture_path, list_captures
+from recipes.renderers import (TextShoppingListRenderer,
+                               CSVShoppingListRenderer,
+                               PDFShoppingListRenderer)
 from users.models import User
 from recipes.serializers import (UserSerializer, UserResponseSerializer,
                                  SetPasswordSerializer, TokenSerializer,
@@ -28,8 +40,8 @@ from recipes.serializers import (UserSerializer, UserResponseSerializer,
                                  RecipeResponsePostUpdateSerializer, )
 
 
-class UserViewSet(viewsets.ModelViewSet):
-    pagination_class = PageNumberPagination
+class UserViewSet(MeasuredSerializerMixin, viewsets.ModelViewSet):
+    pagination_class = FeedPagination
     queryset = User.objects.all()
     serializer_class = UserResponseSerializer
 
@@ -44,7 +56,7 @@ class UserViewSet(viewsets.ModelViewSet):
         return super().retrieve(request, *args, **kwargs)
 
     def create(self, request):
-        serializer = UserSerializer(data=request.data)
+        serializer = measured(UserSerializer(data=request.data))
         serializer.is_valid(raise_exception=True)
         user = User.objects.create_user(
             username=request.data['username'],
@@ -55,18 +67,18 @@ class UserViewSet(viewsets.ModelViewSet):
         )
         Token.objects.create(user=user)
         ShoppingCard.objects.create(user=user)
-        return Response(UserResponseSerializer(user, context={
+        return Response(measured(UserResponseSerializer(user, context={
             'request': request
-        }).data, status=status.HTTP_201_CREATED)
+        })).data, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['get', ])
     def me(self, request):
         self.permission_classes = [permissions.IsAuthenticated]
         super().check_permissions(request)
         return Response(
-            UserResponseSerializer(request.user, context={
+            measured(UserResponseSerializer(request.user, context={
                 'request': request
-            }, many=False).data,
+            }, many=False)).data,
             status=status.HTTP_200_OK
         )
 
@@ -74,12 +86,11 @@ class UserViewSet(viewsets.ModelViewSet):
     def set_password(self, request):
         self.permission_classes = [permissions.IsAuthenticated]
         super().check_permissions(request)
-        serializer = SetPasswordSerializer(data=request.data, context={
-            'user': request.user
-        })
+        serializer = measured(SetPasswordSerializer(
+            data=request.data, context={'user': request.user}))
         serializer.is_valid(raise_exception=True)
         request.user.set_password(request.data['new_password'])
-        request.user.save()
+        request.user.save(update_fields=['password'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['get', ])
@@ -87,19 +98,17 @@ class UserViewSet(viewsets.ModelViewSet):
         self.permission_classes = [permissions.IsAuthenticated]
         super().check_permissions(request)
         subscription = Subscription.objects.filter(user=request.user)
-        users = User.objects.annotate(is_subscribed=Value(True),
-                                      recipes_count=Count(
-                                          'recipe_set')).filter(
+        users = User.objects.annotate(is_subscribed=Value(True)).filter(
             id__in=subscription.values_list(
                 'subscriptions__id', flat=True
             )
-        )
+        ).order_by('-id')
         paginator = self.pagination_class()
-        return paginator.get_paginated_response(
+        return paginator.get_paginated_response(measured(
             UserResponseWithRecipesSerializer(paginator.paginate_queryset(
                 users, request), many=True, context={
                 'recipes_limit': request.query_params.get('recipes_limit')
-            }).data)
+            })).data)
 
     @action(detail=True, methods=['post', 'delete'])
     def subscribe(self, request, pk):
@@ -107,36 +116,28 @@ class UserViewSet(viewsets.ModelViewSet):
         super().check_permissions(request)
         user = get_object_or_404(User, pk=pk)
         user.is_subscribed = True
-        user.recipes_count = user.recipe_set.all().count()
-        serializer = UserResponseWithRecipesWithValidateSerializer(
+        serializer = measured(UserResponseWithRecipesWithValidateSerializer(
             data=request.data,
             context={
                 'user': user,
                 'current_user': request.user,
                 'method': request.method,
-            })
+            }))
         serializer.is_valid(raise_exception=True)
         if request.method == 'POST':
-            Subscription.objects.create(
-                user=request.user,
-                subscriptions=user
-            )
-            return Response(UserResponseWithRecipesSerializer(
+            serializer.save()
+            return Response(measured(UserResponseWithRecipesSerializer(
                 user, many=False
-            ).data, status=status.HTTP_201_CREATED)
-        else:
-            Subscription.objects.get(
-                user=request.user,
-                subscriptions=user
-            ).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            )).data, status=status.HTTP_201_CREATED)
+        serializer.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class TokenViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['post', ])
     def login(self, request):
-        serializer = TokenSerializer(data=request.data, )
+        serializer = measured(TokenSerializer(data=request.data))
         serializer.is_valid(raise_exception=True)
         user = get_object_or_404(User, email=request.data.get('email'))
         token, created = Token.objects.get_or_create(user=user)
@@ -153,123 +154,247 @@ class TokenViewSet(viewsets.ViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class CatalogueCacheMixin:
+    """Кэширование ответов для редко меняющихся каталогов.
+
+    Ответы хранятся под текущей версией каталога и помечаются ETag,
+    поэтому клиент с актуальной копией получает 304 без обращения к БД.
+    """
+
+    catalogue = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args,
+                                    **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = catalogue.get_version(self.catalogue)
+        key = request.get_full_path()
+        etag = catalogue.make_etag(self.catalogue, version, key)
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={'ETag': etag})
+        data = catalogue.get_or_set(
+            self.catalogue, version, key,
+            lambda: handler(request, *args, **kwargs).data
+        )
+        return Response(data, headers={'ETag': etag})
+
+
+class TagViewSet(CatalogueCacheMixin, MeasuredSerializerMixin,
+                 viewsets.ModelViewSet):
+    catalogue = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CatalogueCacheMixin, MeasuredSerializerMixin,
+                        viewsets.ModelViewSet):
+    catalogue = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [rest_framework.DjangoFilterBackend, ]
     filterset_class = IngredientFilter
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    pagination_class = PageNumberPagination
-    queryset = Recipe.objects.all().order_by('-id')
+class RecipeViewSet(MeasuredSerializerMixin, viewsets.ModelViewSet):
+    pagination_class = FeedPagination
+    queryset = Recipe.objects.defer('search_vector').order_by('-id')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly,
                           RecipePermission]
     serializer_class = RecipeResponseSerializer
     filter_backends = [rest_framework.DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        authors = User.objects.all()
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(Favourite.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                is_in_shopping_cart=Exists(
+                    ShoppingCard.recipes.through.objects.filter(
+                        shoppingcard__user=user, recipe=OuterRef('pk'))),
+            )
+            authors = authors.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    user=user, subscriptions=OuterRef('pk'))))
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch('ingredientwithquantity_set',
+                     queryset=IngredientWithQuantity.objects.select_related(
+                         'ingredient')),
+        )
+
     # def list(self, request, *args, **kwargs):
     #     if not self.request.query_params.get('tags'):
     #         self.queryset = Recipe.objects.none()
     #     return super().list(request,*args,**kwargs)
 
     def create(self, request, *args, **kwargs):
-        serializer = RecipeResponsePostUpdateSerializer(
+        serializer = measured(RecipeResponsePostUpdateSerializer(
             data=request.data,
             context={
                 'request': request
             }
-        )
+        ))
         serializer.is_valid(raise_exception=True)
         self.serializer_class = RecipeResponseSerializer
         instance = serializer.save()
-        serializer_result = self.get_serializer(instance)
+        serializer_result = self.get_serializer(
+            self.get_queryset().get(pk=instance.pk))
         return Response(serializer_result.data, status=status.HTTP_201_CREATED)
 
     def update(self, request, pk, *args, **kwargs):
         instance = self.get_object()
-        serializer = RecipeResponsePostUpdateSerializer(instance,
-                                                        data=request.data)
+        serializer = measured(RecipeResponsePostUpdateSerializer(
+            instance, data=request.data))
         serializer.is_valid(raise_exception=True)
         self.serializer_class = RecipeResponseSerializer
         instance = serializer.save()
-        serializer_result = self.get_serializer(instance)
+        serializer_result = self.get_serializer(
+            self.get_queryset().get(pk=instance.pk))
         return Response(serializer_result.data)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            shopping.lock_recipe(instance.pk)
+            instance.delete()
+
     @action(detail=False, methods=['get'])
+    def cookable(self, request):
+        """Рецепты из имеющихся ингредиентов: сначала те, для которых
+        есть всё, затем с одним недостающим ингредиентом и так далее."""
+        try:
+            ingredient_ids = {
+                int(value) for param in request.query_params.getlist(
+                    'ingredients') for value in param.split(',') if value}
+            max_missing = request.query_params.get('max_missing')
+            max_missing = None if max_missing is None else int(max_missing)
+        except ValueError:
+            raise ValidationError({'error': 'Ожидаются целые числа'})
+        if not ingredient_ids:
+            raise ValidationError({'error': 'Укажите ингредиенты'})
+        recipe_ids, missing = get_pantry_index().match(ingredient_ids,
+                                                       max_missing)
+        missing = dict(zip(recipe_ids.tolist(), missing.tolist()))
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(list(missing), request, self)
+        recipes = self.get_queryset().in_bulk(page)
+        data = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes], many=True).data
+        for item in data:
+            item['missing_count'] = missing[item['id']]
+        return paginator.get_paginated_response(data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        paginator = TimelinePagination()
+        page = paginator.paginate_ids(
+            partial(timeline.feed_ids, request.user), request)
+        recipes = self.get_queryset().in_bulk(page)
+        return paginator.get_paginated_response(self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes], many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """Рецепты, которые чаще всего добавляют в избранное вместе
+        с этим. Список кэшируется до следующего пересчёта похожих."""
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        data = catalogue.get_or_set(
+            similarity.CATALOGUE, catalogue.get_version(similarity.CATALOGUE),
+            str(pk), partial(similarity.similar_recipes, pk))
+        if not data:
+            get_object_or_404(Recipe, pk=pk)
+        return Response(data)
+
+    @action(detail=False, methods=['get'],
+            renderer_classes=[TextShoppingListRenderer,
+                              CSVShoppingListRenderer,
+                              PDFShoppingListRenderer])
     def download_shopping_cart(self, request):
         self.permission_classes = [permissions.IsAuthenticated]
         super().check_permissions(request)
-        shopping_carts = ShoppingCard.objects.get(user=request.user)
-        spisok = shopping_carts.recipes.values(
-            name_measurement_unit=Concat(
-                F('ingredients__name'),
-                Value(' ('),
-                F('ingredients__measurement_unit'),
-                Value(')'))
-        ).annotate(amount=Sum('ingredientwithquantity_set__amount')).values(
-            'name_measurement_unit', 'amount')
-        data = {item['name_measurement_unit']: item['amount']
-                for item in spisok if bool(item['amount'])}
-        buffer = io.BytesIO()
-        with io.TextIOWrapper(
-                buffer, encoding="utf-8", write_through=True
-        ) as file:
-            for key, value in data.items():
-                file.write(f"{key} - {value}\n")
-            response = HttpResponse(
-                buffer.getvalue(),
-                content_type="text/plain"
-            )
-            response[
-                "Content-Disposition"
-            ] = "attachment; filename=user-shopping-ingredients.txt"
-            return response
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', amount=F('total_amount')
+        ).order_by('ingredient__name')
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.render_rows(ingredients.iterator(
+                chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE)),
+            content_type=content_type
+        )
+        response[
+            "Content-Disposition"
+        ] = f"attachment; filename=user-shopping-ingredients.{renderer.format}"
+        return response
 
     @action(detail=True, methods=['post', 'delete'])
     def shopping_cart(self, request, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
         shopping_card = get_object_or_404(ShoppingCard, user=request.user)
-        serializer = RecipeShoppingCardSerializer(
+        serializer = measured(RecipeShoppingCardSerializer(
             data=request.data,
             context={
                 'recipe': recipe,
                 'shopping_card': shopping_card,
-                'method': request.method
             }
-        )
+        ))
         serializer.is_valid(raise_exception=True)
         if request.method == 'POST':
-            shopping_card.recipes.add(recipe)
-            return Response(RecipeSerializer(recipe, many=False).data,
+            serializer.save()
+            return Response(measured(RecipeSerializer(recipe)).data,
                             status=status.HTTP_201_CREATED)
-        else:
-            shopping_card.recipes.remove(recipe)
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post', 'delete'])
     def favorite(self, request, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
-        favourite = Favourite.objects.filter(user=request.user,
-                                             recipe=recipe)
-        serializer = RecipeFavouriteSerializer(
+        serializer = measured(RecipeFavouriteSerializer(
             data=request.data,
             context={
-                'favourite': favourite,
-                'method': request.method
+                'user': request.user,
+                'recipe': recipe,
             }
-        )
+        ))
         serializer.is_valid(raise_exception=True)
         if request.method == 'POST':
-            Favourite.objects.create(user=request.user, recipe=recipe)
-            return Response(RecipeSerializer(recipe, many=False).data,
+            serializer.save()
+            return Response(measured(RecipeSerializer(recipe)).data,
                             status=status.HTTP_201_CREATED)
-        else:
-            favourite.first().delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfileCaptureViewSet(viewsets.ViewSet):
+    """Профили запросов и планы медленных SQL-запросов."""
+
+    permission_classes = [permissions.IsAdminUser]
+    lookup_value_regex = r'[\w.-]+'
+
+    def list(self, request):
+        return Response(list_captures())
+
+    def retrieve(self, request, pk=None):
+        path = get_capture_path(pk)
+        if path is None:
+            raise Http404
+        return FileResponse(open(path, 'rb'), as_attachment=True)
@@ -0,0 +1,95 @@
+import copy
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from recipes.catalogue import LRUCache, is_shared_cache
+
+local_cache = LRUCache(settings.TOKEN_CACHE_LOCAL_SIZE)
+
+
+def _cache_key(key):
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _new_version(cache_key):
+    # Версия живёт дольше записи, которую могли заполнить по старой.
+    return cache_key + ':version', uuid.uuid4().hex, (
+        settings.TOKEN_CACHE_TIMEOUT * 2)
+
+
+def get_version(cache_key):
+    version_key, version, timeout = _new_version(cache_key)
+    current = cache.get(version_key)
+    if current is None:
+        cache.add(version_key, version, timeout=timeout)
+        current = cache.get(version_key)
+    return current
+
+
+def invalidate_token(key):
+    """Меняет версию токена и убирает его из кэшей.
+
+    Записи со старой версией, в том числе заполненные запросом, который
+    прочитал токен до выхода, и записи в кэшах других процессов больше
+    не принимаются.
+    """
+    cache_key = _cache_key(key)
+    version_key, version, timeout = _new_version(cache_key)
+    cache.set(version_key, version, timeout=timeout)
+    cache.delete(cache_key)
+    local_cache.delete(cache_key)
+
+
+def invalidate_user(user_id):
+    """Сбрасывает закэшированные токены пользователя."""
+    for key in Token.objects.filter(user_id=user_id).values_list(
+            'key', flat=True):
+        invalidate_token(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД на каждый вызов API.
+
+    Пара токен/пользователь хранится в LRU-кэше процесса в течение
+    `TOKEN_CACHE_LOCAL_TTL` секунд и в общем кэше в течение
+    `TOKEN_CACHE_TIMEOUT` вместе с версией токена, прочитанной до
+    запроса к БД. Каждое попадание сверяется с текущей версией в общем
+    кэше, поэтому выход, смена пароля и изменение пользователя действуют
+    сразу во всех процессах.
+
+    С кэшем в памяти процесса (LocMemCache) сброс не дошёл бы
+    до других процессов, поэтому токен тогда всегда проверяется по БД.
+    """
+
+    def authenticate_credentials(self, key):
+        if not is_shared_cache():
+            return super().authenticate_credentials(key)
+        cache_key = _cache_key(key)
+        now = time.monotonic()
+        version = get_version(cache_key)
+        entry = local_cache.get(cache_key)
+        if entry is not None and entry[0] > now and entry[1] == version:
+            return self.copy(entry[2])
+        cached = cache.get(cache_key)
+        if cached is not None and cached[0] == version:
+            credentials = cached[1]
+        else:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, (version, credentials),
+                      timeout=settings.TOKEN_CACHE_TIMEOUT)
+        local_cache.set(cache_key, (
+            now + settings.TOKEN_CACHE_LOCAL_TTL, version, credentials))
+        return self.copy(credentials)
+
+    @staticmethod
+    def copy(credentials):
+        """Каждый запрос получает свою копию пользователя, чтобы правки
+        `request.user` не попадали в кэш."""
+        user, token = credentials
+        return copy.copy(user), token
@@ -1,9 +1,15 @@
 from django.contrib.auth.models import AbstractUser
+from django.db import models
 
 
 class User(AbstractUser):
     """Модель пользователя."""
 
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Количество рецептов')
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Количество подписчиков')
+
     REQUIRED_FIELDS = ['first_name', 'last_name', 'email']
 
     def __str__(self):
@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users import authentication
+from users.models import User
+
+LOCAL_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        overrides = self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        authentication.local_cache.clear()
+        self.addCleanup(authentication.local_cache.clear)
+        self.user = User.objects.create_user(
+            'cook', 'cook@example.com', 'password', first_name='Имя')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def cached(self):
+        return cache.get(authentication._cache_key(self.token.key))
+
+    def test_credentials_are_cached(self):
+        self.assertEqual(self.me().status_code, 200)
+        version, (user, token) = self.cached()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_logout_revokes_cached_token(self):
+        self.assertEqual(self.me().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(self.cached())
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_logout_during_request_is_not_overwritten(self):
+        read = TokenAuthentication.authenticate_credentials
+
+        def read_then_logout(auth, key):
+            credentials = read(auth, key)
+            with self.captureOnCommitCallbacks(execute=True):
+                Token.objects.filter(key=key).delete()
+            return credentials
+
+        with mock.patch.object(TokenAuthentication,
+                               'authenticate_credentials', read_then_logout):
+            self.assertEqual(self.me().status_code, 200)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_logout_in_other_process_rejects_local_entry(self):
+        self.assertEqual(self.me().status_code, 200)
+        cache_key = authentication._cache_key(self.token.key)
+        entry = authentication.local_cache.get(cache_key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        authentication.local_cache.set(cache_key, entry)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_user_change_refreshes_cached_user(self):
+        self.assertEqual(self.me().status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Новое'
+            self.user.save()
+        self.assertEqual(self.me().data['first_name'], 'Новое')
+
+    def test_process_local_cache_is_not_used(self):
+        with self.settings(CACHES=LOCAL_CACHE):
+            self.assertEqual(self.me().status_code, 200)
+            self.assertIsNone(self.cached())
+            with self.captureOnCommitCallbacks(execute=True):
+                self.token.delete()
+            self.assertEqual(self.me().status_code, 401)
@@ -0,0 +1,11 @@
+#!/bin/sh
+set -e
+
+# Метрики воркеров прошлого запуска лежат в mmap-файлах и суммировались
+# бы с новыми, поэтому каталог очищается перед стартом gunicorn.
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+exec "$@"